@@ -1,55 +1,93 @@
 import copy
+import functools
+import heapq
 import math
+import os
 import random as rd
+import sys
 import time
 
-from dataclasses import dataclass
-from typing import List, Dict, Set
+from array import array
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional
 
+import evaluation
+import log
+import metrics
 import simulator as sim
 
+try:
+    import batch_simulator
+except ImportError:  # the batched simulator needs numpy
+    batch_simulator = None
+
+logger = log.get_logger("ai")
+
+
+# The move filters take the cell of the head and return the moves out of possibleMoves (in the
+# order of sim.MOVES) which pass the filter. possibleMoves is expected to be a list, usually
+# sim.MOVES itself.
 
 # Returns possible_moves without any moves which result in the snake entering out of bounds
-def avoid_oob(board: sim.BoardState, possibleMoves: List[sim.Direction], head: sim.Position):
-    newPossibleMoves = set()
-    for move in possibleMoves:
-        newPos = sim.Position(head.x + move.x, head.y + move.y)
-        if board.is_in_bounds(newPos):
-            newPossibleMoves.add(move)
+def avoid_oob(board: sim.BoardState, possibleMoves: List[sim.Direction], head: sim.Cell):
+    return [move for (move, newPos) in board.geometry.neighbours[head] if move in possibleMoves]
 
-    return newPossibleMoves
 
+def avoid_snakes(board: sim.BoardState, possibleMoves: List[sim.Direction], head: sim.Cell):
+    steps = board.geometry.steps
+    return [move for move in possibleMoves if not board.is_occupied(steps[move][head])]
 
-def avoid_snakes(board: sim.BoardState, possibleMoves: Set[sim.Direction], head: sim.Position):
-    newPossibleMoves = set()
-    for move in possibleMoves:
-        newPos = sim.Position(head.x + move.x, head.y + move.y)
-        for snake in board.snakes.values():
-            if snake.contains(newPos):
-                break
-        else:
-            newPossibleMoves.add(move)
+
+# Like avoid_snakes but also avoids going out of bounds. The tips of tails are treated as free
+# since they will have moved on by the time the head gets there (unless that snake eats).
+def avoid_oob_and_snakes(board: sim.BoardState, possibleMoves: List[sim.Direction], head: sim.Cell):
+    occupancy = board.occupancy
+    newPossibleMoves = []
+    for (move, newPos) in board.geometry.neighbours[head]:
+        if move in possibleMoves:
+            segments = occupancy[newPos]
+            if segments > 0:
+                for s in board.snakes.values():
+                    if s.tail and s.tail[-1] == newPos:
+                        segments -= 1
+
+            if segments <= 0:
+                newPossibleMoves.append(move)
 
     return newPossibleMoves
 
 
-def avoid_oob_and_snakes(board: sim.BoardState, possibleMoves: Set[sim.Direction], head: sim.Position):
-    newPossibleMoves = set()
-    for move in possibleMoves:
-        newPos = sim.Position(head.x + move.x, head.y + move.y)
-        if (board.is_in_bounds(newPos) and
-                not any(map(lambda s: newPos == s.head or newPos in s.tail[:-1], board.snakes.values()))):
-            newPossibleMoves.add(move)
+# MASK_ACTIONS[mask] lists the moves whose bits (1 << index in sim.MOVES) are set in mask
+MASK_ACTIONS = [[m for d, m in enumerate(sim.MOVES) if mask >> d & 1] for mask in range(1 << len(sim.MOVES))]
 
-    return newPossibleMoves
 
+# Returns a bitmask of the moves avoid_oob_and_snakes would allow for every snake on the board. The
+# tail tips are counted once for the whole board rather than rescanning every snake for every move.
+def get_safe_move_masks(board: sim.BoardState):
+    tips = {}
+    for snake in board.snakes.values():
+        if snake.tail:
+            tips[snake.tail[-1]] = tips.get(snake.tail[-1], 0) + 1
+
+    occupancy = board.occupancy
+    neighbours = board.geometry.neighbourIndices
+    masks = {}
+    for k, snake in board.snakes.items():
+        mask = 0
+        for (d, newPos) in neighbours[snake.head]:
+            if occupancy[newPos] <= tips.get(newPos, 0):
+                mask |= 1 << d
+        masks[k] = mask
 
-def find_closest_food(board: sim.BoardState, pos: sim.Position):
+    return masks
+
+
+def find_closest_food(board: sim.BoardState, pos: sim.Cell):
     minDistance = math.inf
     closestFood = None
 
     for food in board.food:
-        dist = sim.distance(pos, food)
+        dist = board.geometry.distance(pos, food)
         if dist < minDistance:
             closestFood = food
             minDistance = dist
@@ -58,15 +96,13 @@ def find_closest_food(board: sim.BoardState, pos: sim.Position):
 
 
 def safe_player(board: sim.BoardState, playerId):
-    possibleMoves = set(sim.MOVES)
-
     head = board.snakes[playerId].head
     # tail = board.snakes[playerIndex].tail
 
-    possibleMoves = avoid_oob_and_snakes(board, possibleMoves, head)
+    possibleMoves = avoid_oob_and_snakes(board, sim.MOVES, head)
 
     if possibleMoves:
-        return list(possibleMoves)[rd.randrange(len(possibleMoves))]
+        return possibleMoves[board.rng.randrange(len(possibleMoves))]
     else:
         return sim.UP  # default to up if all moves are bad
 
@@ -78,13 +114,13 @@ def chase_food(board: sim.BoardState, playerId):
     if closestFood == None:
         return safe_player(board, playerId)
 
-    possibleMoves = avoid_oob_and_snakes(board, set(sim.MOVES), head)
+    possibleMoves = avoid_oob_and_snakes(board, sim.MOVES, head)
 
+    steps = board.geometry.steps
     bestMove = sim.UP
     bestMoveDistance = math.inf
     for move in possibleMoves:
-        newPos = sim.Position(head.x + move.x, head.y + move.y)
-        dist = sim.distance(closestFood, newPos)
+        dist = board.geometry.distance(closestFood, steps[move][head])
         if dist < bestMoveDistance:
             bestMove = move
             bestMoveDistance = dist
@@ -92,11 +128,11 @@ def chase_food(board: sim.BoardState, playerId):
     return bestMove
 
 
-def random_choice(xs, ps):
+def random_choice(xs, ps, rng=rd):
     if len(xs) != len(ps):
         return None
 
-    total = rd.random()
+    total = rng.random()
     for i in range(len(xs)):
         if total < ps[i]:
             return xs[i]
@@ -110,7 +146,7 @@ def simple_player(board: sim.BoardState, playerId):
     STRATEGIES = [safe_player, chase_food]
     PROBABILITIES = [0.10, 0.90]
 
-    return random_choice(STRATEGIES, PROBABILITIES)(board, playerId)
+    return random_choice(STRATEGIES, PROBABILITIES, board.rng)(board, playerId)
 
 
 # ------------------------#
@@ -123,13 +159,186 @@ class RewardInfo:
     totalReward: int
 
 
-@dataclass
-class Node:
-    visitCount: int
-    rewardInfo: Dict[object, Dict[sim.Direction, RewardInfo]]
-
-
-Tree = Dict[sim.BoardState, Node]
+# Index of each move in sim.MOVES
+MOVE_INDEX = {m: d for d, m in enumerate(sim.MOVES)}
+
+
+# Samples the joint actions at a node without replacement. Joint actions are numbered in mixed radix
+# (the digit for each snake indexing its list of actions) and the numbers are drawn by a
+# Fisher-Yates shuffle which is done lazily, one draw at a time, so only the swapped positions are
+# stored. Each draw takes O(#snakes) however many joint actions there are. The sampler also keeps
+# the actions (and their indices in sim.MOVES) for selection to use once the node is fully expanded.
+class JointActionSampler:
+    def __init__(self, actions: Dict[object, List[sim.Direction]]):
+        self.actions = actions
+        self.indices = {k: [MOVE_INDEX[m] for m in ms] for k, ms in actions.items()}
+        self.remaining = math.prod(len(ms) for ms in actions.values())
+        self.swaps = {}
+
+    # Returns a joint action which hasn't been returned before, or None once they all have been
+    def sample(self, rng=rd):
+        if self.remaining == 0:
+            return None
+
+        j = rng.randrange(self.remaining)
+        last = self.remaining - 1
+        index = self.swaps.get(j, j)
+        if j != last:
+            self.swaps[j] = self.swaps.pop(last, last)
+        else:
+            self.swaps.pop(last, None)
+        self.remaining = last
+
+        a = {}
+        for k, ms in self.actions.items():
+            index, i = divmod(index, len(ms))
+            a[k] = ms[i]
+
+        return a
+
+
+# Default limit on the number of nodes in a search tree. Trees are kept between turns, so without a
+# limit long games with long searches would keep growing them.
+MAX_TREE_NODES = int(os.environ.get("BATTLESNAKE_MAX_TREE_NODES", "200000"))
+
+# Fraction of the limit a tree is cut down to when it goes over it, so that evicting (which has to
+# look at every node) only happens once in a while
+EVICTION_TARGET = 0.75
+
+
+# Behaviour shared by the DUCT and SUCT trees, which both work as transposition tables keyed by the
+# hash of a state. Once a tree holds more than maxNodes nodes the searches call evict between
+# iterations, which removes the least visited nodes. The parent of an evicted node still has it as a
+# child, so the searches have to handle reaching a child that isn't in the tree by expanding it
+# again. Subclasses provide visit_count(key) and keep(keys).
+class TranspositionTable:
+    def init_table(self, maxNodes: int):
+        self.maxNodes = maxNodes
+        self.hits = 0       # lookups of a state which was already in the tree
+        self.misses = 0     # states added to the tree
+        self.evictions = 0  # nodes removed by evict
+
+    def over_capacity(self):
+        return len(self) > self.maxNodes
+
+    # Removes the least visited nodes, other than the one with the key root, until the tree is
+    # down to EVICTION_TARGET of its capacity
+    def evict(self, root: int):
+        target = max(int(self.maxNodes * EVICTION_TARGET) - 1, 0)
+        kept = heapq.nlargest(target, (key for key in self if key != root), key=self.visit_count)
+        self.evictions += len(self) - len(kept) - 1
+        self.keep([root] + kept)
+
+    def counters(self):
+        return {"nodes": len(self), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# The nodes of a DUCT search tree, stored as a struct of arrays rather than an object per node so
+# that adding a node doesn't allocate a RewardInfo for every move of every snake. Each node has an
+# integer id and its statistics are at that id in flat arrays:
+#   visits[i]                         times node i has been visited
+#   actionVisits[j], actionRewards[j] visits and total reward of move d (an index into sim.MOVES)
+#                                     for the snake in slot m, at j = (i * #slots + m) * 4 + d
+#   children[i]                       joint action -> key of the child (None until it has one)
+#   unexpanded[i]                     JointActionSampler, created the first time i is expanded
+# Slots are given to the snakes of the first state added to the tree. Nodes are keyed by the hash of
+# their state rather than the state itself so that the search can step a single board forwards and
+# backwards instead of storing a copy of every state.
+class DuctTree(TranspositionTable):
+    def __init__(self, maxNodes=MAX_TREE_NODES):
+        self.init_table(maxNodes)
+        self.clear()
+
+    def clear(self):
+        self.ids: Dict[int, int] = {}
+        self.slots: Optional[Dict[object, int]] = None
+        self.stride = 0
+        self.visits = array("q")
+        self.actionVisits = array("q")
+        self.actionRewards = array("d")
+        self.children: List[Optional[Dict[tuple, int]]] = []
+        self.unexpanded: List[Optional[JointActionSampler]] = []
+
+    def __contains__(self, key: int):
+        return key in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def visit_count(self, key: int):
+        return self.visits[self.ids[key]]
+
+    # Adds a node for the state s and returns its id
+    def add(self, s: sim.BoardState):
+        if self.slots is None:
+            self.slots = {k: m for m, k in enumerate(s.snakes)}
+            self.stride = len(self.slots) * len(sim.MOVES)
+            self.zeroVisits = array("q", [0]) * self.stride
+            self.zeroRewards = array("d", [0.0]) * self.stride
+
+        i = len(self.visits)
+        self.ids[hash(s)] = i
+        self.visits.append(0)
+        self.actionVisits.extend(self.zeroVisits)
+        self.actionRewards.extend(self.zeroRewards)
+        self.children.append(None)
+        self.unexpanded.append(None)
+        return i
+
+    # Returns the index in actionVisits and actionRewards of the first move of snake k at node i
+    def action_index(self, i: int, k):
+        return i * self.stride + self.slots[k] * len(sim.MOVES)
+
+    def add_child(self, i: int, a: Dict[object, sim.Direction], childKey: int):
+        if self.children[i] is None:
+            self.children[i] = {}
+        self.children[i][tuple(a.items())] = childKey
+
+    def get_children(self, i: int):
+        return self.children[i] or {}
+
+    # Returns the statistics of snake k's moves at node i
+    def reward_info(self, i: int, k):
+        j = self.action_index(i, k)
+        return {m: RewardInfo(self.actionVisits[j + d], self.actionRewards[j + d]) for d, m in enumerate(sim.MOVES)}
+
+    # Copies the statistics (but not the children) of node src to node dst
+    def copy_stats(self, src: int, dst: int):
+        self.visits[dst] = self.visits[src]
+        self.actionVisits[dst * self.stride:(dst + 1) * self.stride] = self.actionVisits[src * self.stride:(src + 1) * self.stride]
+        self.actionRewards[dst * self.stride:(dst + 1) * self.stride] = self.actionRewards[src * self.stride:(src + 1) * self.stride]
+
+    # Returns an estimate of the bytes used by the tree (not counting the samplers)
+    def memory_bytes(self):
+        arrays = sum(a.itemsize * len(a) for a in (self.visits, self.actionVisits, self.actionRewards))
+        children = sum(sys.getsizeof(c) for c in self.children if c is not None)
+        return arrays + children + sys.getsizeof(self.ids) + sys.getsizeof(self.children) + sys.getsizeof(self.unexpanded)
+
+    # Removes every node except those with the given keys, giving the ones kept new ids
+    def keep(self, keys):
+        old = (self.ids, self.visits, self.actionVisits, self.actionRewards, self.children, self.unexpanded)
+        (ids, visits, actionVisits, actionRewards, children, unexpanded) = old
+        slots, stride = self.slots, self.stride
+
+        self.clear()
+        if not keys:
+            return
+
+        self.slots, self.stride = slots, stride
+        for key in keys:
+            i = ids[key]
+            self.ids[key] = len(self.visits)
+            self.visits.append(visits[i])
+            self.actionVisits.extend(actionVisits[i * stride:(i + 1) * stride])
+            self.actionRewards.extend(actionRewards[i * stride:(i + 1) * stride])
+            self.children.append(children[i])
+            self.unexpanded.append(unexpanded[i])
+
+
+Tree = DuctTree
 
 
 def get_reward(winner, snake):
@@ -146,179 +355,520 @@ def evaluate_state(s: sim.BoardState):
     return {k: get_reward(winner, k) for k in s.snakes}
 
 
-def get_safe_actions(s: sim.BoardState, k):
-    return avoid_oob_and_snakes(s, sim.MOVES, s.snakes[k].head)
+# Returns a joint action from s (the state of node i) which hasn't been expanded yet, or None if they
+# all have. Snakes with no safe moves move up, matching select_actions_duct.
+def get_unselected_action_matrix(nodes: Tree, i: int, s: sim.BoardState):
+    if nodes.unexpanded[i] is None:
+        masks = get_safe_move_masks(s)
+        nodes.unexpanded[i] = JointActionSampler({k: MASK_ACTIONS[mask] or [sim.UP] for k, mask in masks.items()})
 
+    return nodes.unexpanded[i].sample(s.rng)
 
-def get_all_matrices(possibleMoves: Dict[object, List[sim.Direction]]):
-    p_moves = copy.deepcopy(possibleMoves)
 
-    if not p_moves:
-        return {}
-    elif len(p_moves) == 1:
-        return [{k: m} for k in p_moves for m in p_moves[k]]
-    else:
-        (k, ms) = p_moves.popitem()
-        rest = get_all_matrices(p_moves)
+# Returns the key of the longest snake on the board (the first one in order if there's a tie)
+def longest_snake(s: sim.BoardState):
+    return max(s.snakes, key=lambda k: s.snakes[k].length())
 
-        result = []
-        for d in rest:
-            for m in ms:
-                newDict = copy.deepcopy(d)
-                newDict[k] = m
-                result.append(newDict)
 
-        return result
+def add_node_duct(nodes: Tree, s: sim.BoardState):
+    return nodes.add(s)
 
 
-def get_unselected_action_matrices(nodes: Tree, s: sim.BoardState):
-    possibleActions = {}
-    for k in s.snakes:
-        actions = get_safe_actions(s, k)
-        if actions:
-            possibleActions[k] = actions
-        else:
-            possibleActions[k] = [sim.UP]
+# Scores an unfinished game as won by the longest snake
+def longest_snake_rewards(s: sim.BoardState):
+    longest = longest_snake(s)
+    return {k: get_reward(longest, k) for k in s.snakes}
 
-    return get_all_matrices(possibleActions)
 
+# Turns played by mcts_playout before an unfinished game is scored
+PLAYOUT_TURNS = 50
 
-def apply_action_duct(s: sim.BoardState, a: Dict[object, sim.Direction]):
-    sNew = copy.deepcopy(s)
-    sNew.step(a)
-    return sNew
+# Turns played by evaluation_playout before the position is scored by evaluation.evaluate
+ROLLOUT_DEPTH = int(os.environ.get("BATTLESNAKE_ROLLOUT_DEPTH", "4"))
 
 
-def longest_snake(s: sim.BoardState):
-    index = 0
-    longest_length = s.snakes[0].length()
-    for i in range(1, len(s.snakes)):
-        new_length = s.snakes[i].length()
-        if new_length > longest_length:
-            longest_length = new_length
-            index = i
+# Plays out the rest of the game (up to maxTurns turns) from s and returns the rewards for each
+# snake. If the game hasn't finished by then the snakes still on the board are scored by evaluate
+# and any eliminated during the playout get -1. s is left unchanged.
+def mcts_playout(s: sim.BoardState, maxTurns=PLAYOUT_TURNS, evaluate=longest_snake_rewards):
+    snakes = list(s.snakes)
 
-    return index
+    deltas = []
+    for i in range(maxTurns):
+        if s.winner() != -1:
+            break
+        deltas.append(s.step({k: simple_player(s, k) for k in s.snakes}))
 
+    if s.winner() != -1:
+        rs = {k: get_reward(s.winner(), k) for k in snakes}
+    else:
+        scored = evaluate(s)
+        rs = {k: scored.get(k, -1.0) for k in snakes}
 
-def add_node_duct(nodes: Tree, s: sim.BoardState):
-    nodes[s] = Node(0, {k: {m: RewardInfo(0, 0) for m in sim.MOVES} for k in s.snakes})
+    for delta in reversed(deltas):
+        s.undo(delta)
 
+    return rs
 
-def mcts_playout(s: sim.BoardState):
-    sCopy = copy.deepcopy(s)
-    for i in range(50):
-        if sCopy.winner() != -1:
-            break
-        sCopy.step({k: simple_player(sCopy, k) for k in sCopy.snakes})
 
-    if sCopy.winner() != -1:
-        return {k: get_reward(sCopy.winner(), k) for k in s.snakes}
-    else:
-        longest = longest_snake(sCopy)
-        return {k: get_reward(longest, k) for k in s.snakes}
+# Playout which only plays a few turns before scoring the position with the static evaluation, so
+# each search iteration is much cheaper than with a full mcts_playout
+evaluation_playout = functools.partial(mcts_playout, maxTurns=ROLLOUT_DEPTH, evaluate=evaluation.evaluate)
 
 
-def update_node_duct(nodes: Tree, s: sim.BoardState, actions: Dict[object, sim.Direction], rs):
-    for k in actions:
-        a = actions[k]
-        nodes[s].rewardInfo[k][a].totalReward += rs.get(k, -1.0)
-        nodes[s].rewardInfo[k][a].visitCount += 1
-    nodes[s].visitCount += 1
+# Number of games simulated at once by mcts_playout_batched. Every batch pays for each turn played
+# with numpy however few games it holds, so a leaf costs tens of ms even for small batches, and
+# large ones (256 games took about 140 ms on an 11x11 board) leave time for only a handful of
+# iterations per move.
+BATCH_ROLLOUTS = int(os.environ.get("BATTLESNAKE_BATCH_ROLLOUTS", "16"))
 
+# Random number generator used by mcts_playout_batched (see batch_simulator.BIT_GENERATORS)
+BATCH_BIT_GENERATOR = os.environ.get("BATTLESNAKE_BATCH_RNG", "pcg64")
 
-def ucb_duct(tR: int, n: int, n_a: int, c=1.0):
-    if n_a == 0:
-        return math.inf
-    else:
-        return (tR / n_a) + c * math.sqrt(math.log(n) / n_a)
 
+# Alternative to mcts_playout which plays out many games from s at once on the batched simulator
+# and returns the average reward over the rollouts games for each snake. Requires numpy.
+def mcts_playout_batched(s: sim.BoardState, rollouts=BATCH_ROLLOUTS, maxTurns=PLAYOUT_TURNS):
+    return batch_simulator.batch_playout(
+        s, rollouts, maxTurns, seed=s.rng.getrandbits(64), bitGenerator=BATCH_BIT_GENERATOR
+    )
+
+
+# Number of plies a SearchPath has room for before it has to grow
+PATH_CAPACITY = 256
+
+
+# The nodes visited by one iteration of a search, with the action taken from each and the delta
+# needed to undo it, kept in lists which are allocated once per search and reused by every
+# iteration. A node is whatever handle the search uses for it (an id in a DuctTree, a NodeSUCT).
+class SearchPath:
+    def __init__(self, capacity=PATH_CAPACITY):
+        self.nodes = [None] * capacity
+        self.actions = [None] * capacity
+        self.deltas = [None] * capacity
+        self.depth = 0
+
+    def push(self, node, action, delta):
+        if self.depth == len(self.nodes):
+            self.nodes.append(None)
+            self.actions.append(None)
+            self.deltas.append(None)
 
-def select_actions_duct(nodes: Tree, s: sim.BoardState):
+        self.nodes[self.depth] = node
+        self.actions[self.depth] = action
+        self.deltas[self.depth] = delta
+        self.depth += 1
+
+
+# Runs one iteration of a search from s: selects actions down the tree until it reaches a terminal
+# state or a node with an unexpanded action, expands that action, runs a playout from the new node
+# and then walks back up the path undoing each step and updating each node with the rewards. s is
+# restored to its original state before returning. The tree specific parts (and getting the board to
+# play out from s) are done by search (see DuctSearch and SuctSearch).
+def mcts_iter(search, nodes, s, playout, path: SearchPath):
+    path.depth = 0
+    node = search.root(nodes, s)
+    while True:
+        if s.winner() != -1:  # if in a terminal state
+            rs = search.terminal_rewards(s)
+            break
+
+        a = search.unexpanded_action(nodes, node, s)
+        if a is not None:
+            delta = s.step(a)
+            path.push(node, a, delta)
+            child = search.expand(nodes, node, a, s, delta)
+        else:  # selection phase
+            a = search.select(nodes, node, s)
+            delta = s.step(a)
+            path.push(node, a, delta)
+            node = search.child(nodes, node, a, s)
+            if node is not None:
+                continue
+
+            # The child has been evicted since it was expanded (or this joint action was never
+            # expanded because it reached the same state as another one)
+            child = search.expand(nodes, path.nodes[path.depth - 1], a, s, delta)
+
+        rs = playout(search.board(s))
+        search.visit(nodes, child)
+        break
+
+    for d in range(path.depth - 1, -1, -1):
+        s.undo(path.deltas[d])
+        search.update(nodes, path.nodes[d], path.actions[d], rs)
+
+    return rs
+
+
+# Wraps the search given to mcts_iter to record the time each iteration spends selecting, expanding
+# and backpropagating (see metrics), and the deepest ply reached. Only used when metrics are enabled.
+class InstrumentedSearch:
+    def __init__(self, search):
+        self.search = search
+        self.maxDepth = 0
+
+    def board(self, s):
+        return self.search.board(s)
+
+    def root(self, nodes, s):
+        self.plies = 0
+        self.selectionTime = 0.0
+        self.expansionTime = 0.0
+        self.backpropagationTime = 0.0
+
+        tStart = time.perf_counter()
+        node = self.search.root(nodes, s)
+        self.selectionTime += time.perf_counter() - tStart
+        return node
+
+    def end_selection(self):
+        self.maxDepth = max(self.maxDepth, self.plies)
+        metrics.PHASE_SECONDS.observe(self.selectionTime, "selection")
+
+    def terminal_rewards(self, s):
+        self.end_selection()
+        return self.search.terminal_rewards(s)
+
+    def unexpanded_action(self, nodes, node, s):
+        tStart = time.perf_counter()
+        a = self.search.unexpanded_action(nodes, node, s)
+        if a is None:
+            self.selectionTime += time.perf_counter() - tStart
+        else:
+            self.expansionTime += time.perf_counter() - tStart
+            self.plies += 1
+        return a
+
+    def select(self, nodes, node, s):
+        tStart = time.perf_counter()
+        a = self.search.select(nodes, node, s)
+        self.selectionTime += time.perf_counter() - tStart
+        self.plies += 1
+        return a
+
+    def child(self, nodes, node, a, s):
+        tStart = time.perf_counter()
+        child = self.search.child(nodes, node, a, s)
+        self.selectionTime += time.perf_counter() - tStart
+        return child
+
+    def expand(self, nodes, parent, a, s, delta):
+        self.end_selection()
+        tStart = time.perf_counter()
+        child = self.search.expand(nodes, parent, a, s, delta)
+        metrics.PHASE_SECONDS.observe(self.expansionTime + time.perf_counter() - tStart, "expansion")
+        return child
+
+    def visit(self, nodes, node):
+        self.search.visit(nodes, node)
+
+    def update(self, nodes, node, a, rs):
+        tStart = time.perf_counter()
+        self.search.update(nodes, node, a, rs)
+        self.backpropagationTime += time.perf_counter() - tStart
+
+        self.plies -= 1
+        if self.plies == 0:
+            metrics.PHASE_SECONDS.observe(self.backpropagationTime, "backpropagation")
+
+
+def update_node_duct(nodes: Tree, i: int, actions: Dict[object, sim.Direction], rs):
+    for k in actions:
+        j = nodes.action_index(i, k) + MOVE_INDEX[actions[k]]
+        nodes.actionRewards[j] += rs.get(k, -1.0)
+        nodes.actionVisits[j] += 1
+    nodes.visits[i] += 1
+
+
+# Returns the UCB scores of a list of actions from their total rewards and visit counts at a node
+# visited n times, doing the log once for all of them
+def ucb_scores(totalRewards, visitCounts, n: int, c=1.0):
+    logN = math.log(n) if n > 0 else 0.0
+    return [
+        (tR / nA) + c * math.sqrt(logN / nA) if nA else math.inf
+        for (tR, nA) in zip(totalRewards, visitCounts)
+    ]
+
+
+# Picks each snake's action at node i with the highest UCB score. The scores of every move of every
+# snake at the node are computed in one go from its slice of the statistics arrays, and only the safe
+# actions cached when the node was expanded are considered, so the board isn't scanned again.
+def select_actions_duct(nodes: Tree, i: int):
+    start = i * nodes.stride
+    end = start + nodes.stride
+    scores = ucb_scores(nodes.actionRewards[start:end], nodes.actionVisits[start:end], nodes.visits[i])
+
+    sampler = nodes.unexpanded[i]
     result = {}
-    for k in s.snakes:
-        bestAction = sim.UP
-        bestActionUCB = -math.inf
-        for a in get_safe_actions(s, k):
-            rewardInfo = nodes[s].rewardInfo[k][a]
-            tR = rewardInfo.totalReward
-            nA = rewardInfo.visitCount
-            n = nodes[s].visitCount
-
-            ucb = ucb_duct(tR, n, nA)
-            if ucb > bestActionUCB:
-                bestAction = a
-                bestActionUCB = ucb
-
-        result[k] = bestAction
+    for k, indices in sampler.indices.items():
+        base = nodes.slots[k] * len(sim.MOVES)
+        result[k] = sim.MOVES[max(indices, key=lambda d: scores[base + d])]
 
     return result
 
 
-def mcts_duct_iter(nodes: Tree, s: sim.BoardState):
-    if s.winner() != -1:  # if in a terminal state
+# Adds the state s (reached from the node with the id parent by the joint action a) to the tree if
+# it isn't already there, and returns its id
+def expand_duct(nodes: Tree, parent: int, a: Dict[object, sim.Direction], s: sim.BoardState):
+    key = hash(s)
+    i = nodes.ids.get(key)
+    if i is None:
+        i = add_node_duct(nodes, s)
+        nodes.misses += 1
+    else:
+        nodes.hits += 1
+    nodes.add_child(parent, a, key)
+    return i
+
+
+# The DUCT specific parts of mcts_iter. Nodes are identified by their id in the tree.
+class DuctSearch:
+    def root(self, nodes: Tree, s: sim.BoardState):
+        return nodes.ids[hash(s)]
+
+    def board(self, s: sim.BoardState):
+        return s
+
+    def terminal_rewards(self, s: sim.BoardState):
         return evaluate_state(s)
-    elif s in nodes and (actionMats := get_unselected_action_matrices(nodes, s)):
-        a = actionMats[rd.randrange(len(actionMats))]
 
-        # Calculate next state
-        sNew = apply_action_duct(s, a)
+    def unexpanded_action(self, nodes: Tree, i: int, s: sim.BoardState):
+        return get_unselected_action_matrix(nodes, i, s)
+
+    def select(self, nodes: Tree, i: int, s: sim.BoardState):
+        return select_actions_duct(nodes, i)
+
+    # Returns the id of the node reached from i by the joint action a (s is its state), or None if
+    # it isn't in the tree
+    def child(self, nodes: Tree, i: int, a: Dict[object, sim.Direction], s: sim.BoardState):
+        key = hash(s)
+        child = nodes.ids.get(key)
+        if child is not None:
+            nodes.hits += 1
+            nodes.add_child(i, a, key)
+        return child
+
+    def expand(self, nodes: Tree, parent: int, a: Dict[object, sim.Direction], s: sim.BoardState, delta):
+        return expand_duct(nodes, parent, a, s)
+
+    def visit(self, nodes: Tree, i: int):
+        nodes.visits[i] += 1
+
+    def update(self, nodes: Tree, i: int, a: Dict[object, sim.Direction], rs):
+        update_node_duct(nodes, i, a, rs)
+
+
+DUCT_SEARCH = DuctSearch()
+
+
+# Runs one iteration of the DUCT search from s (see mcts_iter). Searches which run many iterations
+# pass in a path to reuse.
+def mcts_duct_iter(nodes: Tree, s: sim.BoardState, playout=mcts_playout, path=None):
+    return mcts_iter(DUCT_SEARCH, nodes, s, playout, path or SearchPath())
+
 
-        # Add new state to the tree
-        add_node_duct(nodes, sNew)
+# Returns the moves each snake made to get from prev to board, for the snakes on both boards
+def infer_moves(prev: sim.BoardState, board: sim.BoardState):
+    moves = {}
+    for k, snake in board.snakes.items():
+        if k in prev.snakes:
+            move = board.geometry.move_between(prev.snakes[k].head, snake.head)
+            if move is not None:
+                moves[k] = move
 
-        rs = mcts_playout(sNew)
+    return moves
 
-        nodes[sNew].visitCount += 1
 
-        update_node_duct(nodes, s, a, rs)
-        return rs
+# Removes every node which can't be reached from the node with the key root
+def prune_duct(nodes: Tree, root: int):
+    reachable = [root]
+    seen = {root}
+    stack = [root]
+    while stack:
+        for child in nodes.get_children(nodes.ids[stack.pop()]).values():
+            if child in nodes and child not in seen:
+                seen.add(child)
+                reachable.append(child)
+                stack.append(child)
 
-    else:  # selection phase
-        actions = select_actions_duct(nodes, s)
-        sNew = apply_action_duct(s, actions)
-        rs = mcts_duct_iter(nodes, sNew)
-        update_node_duct(nodes, s, actions, rs)
-        return rs
+    nodes.keep(reachable)
 
 
-def mcts_duct(board: sim.BoardState, playerIndex, maxTime=150):
-    tStart = time.time_ns()
+# Moves the root of a tree built by a search from the position with the key prevKey to board,
+# which was reached a turn later by the snakes making the given moves (see infer_moves). If board is
+# already in the tree it becomes the root. Otherwise (usually because food spawned, which the search
+# doesn't simulate) the statistics of the child reached by the moves are carried over to board, but
+# that child's subtree has to be dropped since it was built with the old food. Everything not
+# reachable from the new root is removed.
+def reroot_duct(nodes: Tree, prevKey, moves: Dict[object, sim.Direction], board: sim.BoardState):
+    key = hash(board)
 
-    s = copy.deepcopy(board)
+    if key not in nodes:
+        # Without the move of every snake still on the board (e.g. after a missed turn) any child
+        # could be the one that was played, so the tree is dropped rather than guessing
+        if prevKey not in nodes or any(k not in moves for k in board.snakes):
+            nodes.clear()
+            return
+
+        candidates = [
+            nodes.ids[child] for (a, child) in nodes.get_children(nodes.ids[prevKey]).items()
+            if child in nodes and all(moves.get(k, m) == m for (k, m) in a)
+        ]
+        if not candidates:
+            nodes.clear()
+            return
+
+        child = max(candidates, key=lambda i: nodes.visits[i])
+        nodes.copy_stats(child, add_node_duct(nodes, board))
+
+    prune_duct(nodes, key)
+
+
+# How often (in iterations) the searches check whether they can stop early
+EARLY_STOP_INTERVAL = 16
+
+
+# Returns the time.perf_counter() value a search started at tStart should stop at
+def search_deadline(tStart: float, maxTime: float, deadline=None):
+    if deadline is None:
+        return tStart + maxTime / 1000
+    else:
+        return deadline
+
+
+# Returns True if the move picked by best_move can't change in the given number of remaining
+# iterations, even if every one of them went against it. Only the moves in actions (the ones the
+# search can visit) are considered.
+def best_move_decided(rewardInfo: Dict[sim.Direction, RewardInfo], actions, remaining: float):
+    if len(actions) <= 1:
+        return True
+
+    best = best_move(rewardInfo)
+    if best not in rewardInfo or rewardInfo[best].visitCount == 0:
+        return False
+
+    # Worst case average reward of the best move against the best case of each of the others
+    bestWorstCase = (rewardInfo[best].totalReward - remaining) / (rewardInfo[best].visitCount + remaining)
+    for a in actions:
+        if a != best and a in rewardInfo and rewardInfo[a].visitCount + remaining > 0:
+            if (rewardInfo[a].totalReward + remaining) / (rewardInfo[a].visitCount + remaining) >= bestWorstCase:
+                return False
+
+    return True
+
+
+# Estimates how many more iterations a search will get through before its deadline
+def remaining_iterations(tStart: float, iterations: int, deadline: float):
+    now = time.perf_counter()
+    return iterations / max(now - tStart, 1e-9) * max(deadline - now, 0.0)
+
+
+# Runs DUCT iterations from board for maxTime ms, or until deadline (a time.perf_counter() value) if
+# one is given. Returns the reward info for every snake's moves at the root and the number of
+# iterations that were run. If a tree is passed in as nodes it is added to (and its statistics for
+# board are reused) rather than starting a new tree. If playerIndex is given the search stops early
+# once that snake's best move at the root can no longer change. The search's random choices are
+# drawn from a generator seeded with seed (or an unseeded one), not from board.rng.
+def search_duct(board: sim.BoardState, maxTime=150, playout=mcts_playout, nodes=None, deadline=None, playerIndex=None, seed=None):
+    tStart = time.perf_counter()
+    deadline = search_deadline(tStart, maxTime, deadline)
+
+    with metrics.phase("clone"):
+        s = copy.deepcopy(board)
     s.foodSpawnChance = 0
+    s.rng = rd.Random(seed)
+
+    if nodes is None:
+        nodes = DuctTree()
+    rootKey = hash(s)
+    if rootKey not in nodes:
+        add_node_duct(nodes, s)
+
+    if playerIndex is not None:
+        playerActions = MASK_ACTIONS[get_safe_move_masks(s)[playerIndex]]
+
+    search = DUCT_SEARCH
+    if metrics.ENABLED:
+        search = InstrumentedSearch(search)
+        playout = metrics.timed("playout", playout)
+
+    path = SearchPath()
+    iterations = 0
+    while time.perf_counter() < deadline:
+        mcts_iter(search, nodes, s, playout, path)
+        iterations += 1
+
+        if nodes.over_capacity():
+            nodes.evict(rootKey)
+
+        if (playerIndex is not None and iterations % EARLY_STOP_INTERVAL == 0 and
+                best_move_decided(nodes.reward_info(nodes.ids[rootKey], playerIndex), playerActions, remaining_iterations(tStart, iterations, deadline))):
+            break
+
+    logger.debug("DUCT searched %d iterations, %s", iterations, nodes.counters())
+    if metrics.ENABLED:
+        metrics.record_search("duct", iterations, len(nodes), search.maxDepth, nodes.memory_bytes())
+    root = nodes.ids[rootKey]
+    return {k: nodes.reward_info(root, k) for k in s.snakes}, iterations
+
+
+# Carries on a DUCT search of the tree nodes from s, which must be a search copy of the board (see
+# search_duct), until stop() returns True. stop is checked after every iteration so that the caller
+# gets the tree back quickly. Returns the number of iterations that were run.
+def ponder_duct(nodes: Tree, s: sim.BoardState, stop, playout=mcts_playout, path=None):
+    rootKey = hash(s)
+    if rootKey not in nodes:
+        add_node_duct(nodes, s)
+
+    path = path or SearchPath()
+    iterations = 0
+    while not stop():
+        mcts_iter(DUCT_SEARCH, nodes, s, playout, path)
+        iterations += 1
 
-    nodes = {}
-    add_node_duct(nodes, s)
-    while time.time_ns() - tStart < maxTime * 1000000:
-        mcts_duct_iter(nodes, s)
+        if nodes.over_capacity():
+            nodes.evict(rootKey)
 
+    return iterations
+
+
+# Returns the move with the highest average reward out of the root reward info for one snake
+def best_move(rewardInfo: Dict[sim.Direction, RewardInfo]):
     bestMove = sim.MOVES[0]
     bestMoveReward = -math.inf
     for m in sim.MOVES:
-        rewardInfo = nodes[s].rewardInfo[playerIndex][m]
-        if rewardInfo.visitCount != 0:
-            r = rewardInfo.totalReward / rewardInfo.visitCount
+        if m in rewardInfo and rewardInfo[m].visitCount != 0:
+            r = rewardInfo[m].totalReward / rewardInfo[m].visitCount
 
             if r > bestMoveReward:
                 bestMove = m
                 bestMoveReward = r
 
-    print("DUCT Nodes Visited:", len(nodes))
     return bestMove
 
 
+def mcts_duct(board: sim.BoardState, playerIndex, maxTime=150, playout=mcts_playout, nodes=None, deadline=None, seed=None):
+    rootInfo, iterations = search_duct(board, maxTime, playout, nodes, deadline, playerIndex, seed)
+    return best_move(rootInfo[playerIndex])
+
+
 # ----- SUCT -----#
 
+ZOBRIST_PENDING_MOVE = sim.SnakeZobristTable(101)  # keyed by (snake id, move)
+ZOBRIST_TURN_INDEX = sim.ZobristTable(102)
+
+
 class StateSUCT:
     def __init__(self, state: sim.BoardState, turnOrder: List[object]):
         self.state = state
         self.moves = {}
+        self.movesHash = 0
         self.turn = 0
         self.turnOrder = turnOrder
 
     def __hash__(self):
-        return 0  # TODO: change this
+        return hash(self.state) ^ self.movesHash ^ ZOBRIST_TURN_INDEX[self.turn]
 
     def __eq__(self, other):
         return (
@@ -328,13 +878,31 @@ class StateSUCT:
                 (self.turnOrder == other.turnOrder)
         )
 
+    # Records the move for the current player, stepping the board once every player has moved.
+    # Returns a delta which can be passed to undo.
     def step(self, move: sim.Direction):
-        self.moves[self.current_turn_player()] = move
+        player = self.current_turn_player()
+        self.moves[player] = move
+        self.movesHash ^= ZOBRIST_PENDING_MOVE[(player, move)]
         self.turn = (self.turn + 1) % len(self.turnOrder)
 
         if self.turn == 0:
-            self.state.step(self.moves)
+            delta = (self.moves, self.movesHash, self.state.step(self.moves))
             self.moves = {}
+            self.movesHash = 0
+            return delta
+
+        return None
+
+    def undo(self, delta):
+        if delta is not None:
+            (self.moves, self.movesHash, boardDelta) = delta
+            self.state.undo(boardDelta)
+
+        self.turn = (self.turn - 1) % len(self.turnOrder)
+
+        player = self.current_turn_player()
+        self.movesHash ^= ZOBRIST_PENDING_MOVE[(player, self.moves.pop(player))]
 
     def current_turn_player(self):
         return self.turnOrder[self.turn]
@@ -347,130 +915,182 @@ class StateSUCT:
 class NodeSUCT:
     visitCount: int
     rewards: Dict[object, float]
+    actions: Optional[List[sim.Direction]] = None  # safe actions of the player to move, set on expansion
+    safeMasks: Optional[Dict[object, int]] = None  # see get_safe_move_masks, shared by a round's nodes
+    children: Dict[sim.Direction, int] = field(default_factory=dict)  # action -> key of child
 
 
-TreeSUCT = Dict[StateSUCT, NodeSUCT]
+# SUCT nodes are keyed by the hash of their StateSUCT. An evicted child is reported by
+# get_unselected_actions as unexpanded again, so it is re-expanded before selection looks at it.
+class TreeSUCT(TranspositionTable, dict):
+    def __init__(self, maxNodes=MAX_TREE_NODES):
+        super().__init__()
+        self.init_table(maxNodes)
 
+    def visit_count(self, key: int):
+        return self[key].visitCount
 
-def apply_action_suct(s: StateSUCT, a: sim.Direction):
-    sNew = copy.deepcopy(s)
-    sNew.step(a)
-    return sNew
+    def keep(self, keys):
+        kept = {key: self[key] for key in keys}
+        self.clear()
+        self.update(kept)
 
+    # Returns an estimate of the bytes used by the tree
+    def memory_bytes(self):
+        nodes = sum(sys.getsizeof(n) + sys.getsizeof(n.rewards) + sys.getsizeof(n.children) for n in self.values())
+        return sys.getsizeof(self) + nodes
 
-def get_unselected_actions(nodes: TreeSUCT, s: StateSUCT):
-    # TODO: improve this
-    possible_actions = []
-    for a in get_safe_actions(s.state, s.current_turn_player()):
-        sNew = apply_action_suct(s, a)
 
-        if sNew not in nodes:
-            possible_actions.append(a)
+# Returns the actions from s which haven't been expanded (or whose child has been evicted). The
+# player's safe actions are worked out the first time and kept on the node. A player with no safe
+# actions moves up, as in DUCT, as does a player who has already been eliminated (their move is
+# ignored by the board but keeps the turn order intact).
+def get_unselected_actions(nodes: TreeSUCT, node: NodeSUCT, s: StateSUCT):
+    if node.actions is None:
+        if node.safeMasks is None:
+            node.safeMasks = get_safe_move_masks(s.state)
+        node.actions = MASK_ACTIONS[node.safeMasks.get(s.current_turn_player(), 0)] or [sim.UP]
 
-    return possible_actions
+    return [a for a in node.actions if node.children.get(a) not in nodes]
 
 
 def add_node_suct(nodes: TreeSUCT, s: StateSUCT):
-    nodes[s] = NodeSUCT(0, {k: 0 for k in s.state.snakes})
+    nodes[hash(s)] = NodeSUCT(0, {k: 0 for k in s.state.snakes})
+    nodes.misses += 1
 
 
-def update_node_suct(nodes: TreeSUCT, s: StateSUCT, a: sim.Direction, rs):
-    for snake in s.state.snakes:
-        # TODO: change this
-        try:
-            nodes[s].rewards[snake] += rs[snake]
-        except:
-            nodes[s].rewards[snake] -= 1.0
-    nodes[s].visitCount += 1
+# Adds the rewards to every snake which was on the board at the node. Snakes eliminated below the
+# node get -1.
+def update_node_suct(node: NodeSUCT, rs):
+    for snake in node.rewards:
+        node.rewards[snake] += rs.get(snake, -1.0)
+    node.visitCount += 1
 
 
-def ucb_suct(r, n, N, c=1.0):
-    if n == 0:
-        return math.inf
-    return (r / n) + c * math.sqrt(math.log(N) / n)
+# Picks the action with the highest UCB score, following the node's child pointers to the
+# children's statistics. Only called once every action has been expanded.
+def select_action_suct(nodes: TreeSUCT, node: NodeSUCT, s: StateSUCT):
+    player = s.current_turn_player()
 
+    # A player who isn't on the board at a child was eliminated by the move into it, so every visit
+    # to the child counts as a reward of -1 for them
+    children = [nodes[node.children[a]] for a in node.actions]
+    scores = ucb_scores([child.rewards.get(player, -child.visitCount) for child in children], [child.visitCount for child in children], node.visitCount)
 
-def select_action_suct(nodes: TreeSUCT, s: StateSUCT):
-    possible_actions = get_safe_actions(s.state, s.current_turn_player())
-    if not possible_actions:
-        return None
+    return node.actions[max(range(len(node.actions)), key=scores.__getitem__)]
 
-    bestAction = sim.UP
-    bestActionUCB = -math.inf
-    for a in possible_actions:
-        sNew = apply_action_suct(s, a)
-        # TODO: change this
-        try:
-            r = nodes[sNew].rewards[s.current_turn_player()]
-        except:
-            r = -1.0
-        n = nodes[sNew].visitCount
-        N = nodes[s].visitCount
-        ucb = ucb_suct(r, n, N)
 
-        if ucb > bestActionUCB:
-            bestAction = a
-            bestActionUCB = ucb
+# The SUCT specific parts of mcts_iter. Nodes are identified by their NodeSUCT.
+class SuctSearch:
+    def root(self, nodes: TreeSUCT, s: StateSUCT):
+        return nodes[hash(s)]
 
-    return bestAction
+    def board(self, s: StateSUCT):
+        return s.state
 
-
-def mcts_iter_suct(nodes: TreeSUCT, s: StateSUCT):
-    if s.winner() != -1:  # if in terminal state
+    def terminal_rewards(self, s: StateSUCT):
         return evaluate_state(s.state)
-    elif s in nodes and (actions := get_unselected_actions(nodes, s)):
-        a = list(actions)[rd.randrange(len(actions))]
 
-        # Calculate next state
-        sNew = apply_action_suct(s, a)
+    def unexpanded_action(self, nodes: TreeSUCT, node: NodeSUCT, s: StateSUCT):
+        actions = get_unselected_actions(nodes, node, s)
+        return actions[s.state.rng.randrange(len(actions))] if actions else None
+
+    def select(self, nodes: TreeSUCT, node: NodeSUCT, s: StateSUCT):
+        return select_action_suct(nodes, node, s)
+
+    # Every child is in the tree once selection starts at a node
+    def child(self, nodes: TreeSUCT, node: NodeSUCT, a: sim.Direction, s: StateSUCT):
+        nodes.hits += 1
+        return nodes[hash(s)]
+
+    # Adds s to the tree if it isn't already there. The board only changes once every player has
+    # moved (delta is None until then), so until then the child can share the safe move masks.
+    def expand(self, nodes: TreeSUCT, parent: NodeSUCT, a: sim.Direction, s: StateSUCT, delta):
+        key = hash(s)
+        if key not in nodes:
+            add_node_suct(nodes, s)
+            if delta is None:
+                nodes[key].safeMasks = parent.safeMasks
+        else:
+            nodes.hits += 1
+        parent.children[a] = key
+        return nodes[key]
+
+    def visit(self, nodes: TreeSUCT, node: NodeSUCT):
+        node.visitCount += 1
 
-        # Add new state to the tree
-        add_node_suct(nodes, sNew)
+    def update(self, nodes: TreeSUCT, node: NodeSUCT, a: sim.Direction, rs):
+        update_node_suct(node, rs)
 
-        rs = mcts_playout(sNew.state)
 
-        nodes[sNew].visitCount += 1
+SUCT_SEARCH = SuctSearch()
 
-        update_node_suct(nodes, s, a, rs)
-        return rs
 
-    else:  # selection phase
-        a = select_action_suct(nodes, s)
-        sNew = apply_action_suct(s, a)
-        rs = mcts_iter_suct(nodes, sNew)
-        update_node_suct(nodes, s, a, rs)
-        return rs
+# Runs one iteration of the SUCT search from s (see mcts_iter). Searches which run many iterations
+# pass in a path to reuse.
+def mcts_iter_suct(nodes: TreeSUCT, s: StateSUCT, playout=mcts_playout, path=None):
+    return mcts_iter(SUCT_SEARCH, nodes, s, playout, path or SearchPath())
 
 
-def mcts_suct(board: sim.BoardState, playerIndex, maxTime=150):
-    tStart = time.time_ns()
+# Returns the reward info for each of the moves of the player moving first from s
+def root_info_suct(nodes: TreeSUCT, s: StateSUCT, playerIndex):
+    rootInfo = {}
+    for a, key in nodes[hash(s)].children.items():
+        if key in nodes and playerIndex in nodes[key].rewards:
+            rootInfo[a] = RewardInfo(nodes[key].visitCount, nodes[key].rewards[playerIndex])
 
-    boardCopy = copy.deepcopy(board)
+    return rootInfo
+
+
+# Runs SUCT iterations from board for maxTime ms (or until deadline) with playerIndex moving first,
+# stopping early once playerIndex's best move can no longer change. Returns the reward info for
+# each of playerIndex's moves at the root and the number of iterations that were run. Random choices
+# are drawn from a generator seeded with seed, as in search_duct.
+def search_suct(board: sim.BoardState, playerIndex, maxTime=150, playout=mcts_playout, deadline=None, seed=None):
+    tStart = time.perf_counter()
+    deadline = search_deadline(tStart, maxTime, deadline)
+
+    with metrics.phase("clone"):
+        boardCopy = copy.deepcopy(board)
     boardCopy.foodSpawnChance = 0
+    boardCopy.rng = rd.Random(seed)
 
     turnOrder = [playerIndex] + [k for k in boardCopy.snakes if k != playerIndex]
 
     s = StateSUCT(boardCopy, turnOrder)
 
-    nodes = {}
+    nodes = TreeSUCT()
     add_node_suct(nodes, s)
-    while time.time_ns() - tStart < maxTime * 1000000:
-        mcts_iter_suct(nodes, s)
+    rootKey = hash(s)
 
-    bestMove = sim.MOVES[0]
-    bestMoveReward = -math.inf
-    for a in sim.MOVES:
-        sNew = apply_action_suct(s, a)
-        try:
-            node = nodes[sNew]
-            r = node.rewards[playerIndex] / node.visitCount
+    playerActions = MASK_ACTIONS[get_safe_move_masks(s.state)[playerIndex]]
 
-            if r > bestMoveReward:
-                bestMove = a
-                bestMoveReward = r
+    search = SUCT_SEARCH
+    if metrics.ENABLED:
+        search = InstrumentedSearch(search)
+        playout = metrics.timed("playout", playout)
 
-        except:
-            pass
+    path = SearchPath()
+    iterations = 0
+    while time.perf_counter() < deadline:
+        mcts_iter(search, nodes, s, playout, path)
+        iterations += 1
 
-    print("SUCT nodes visited:", len(nodes))
-    return bestMove
+        if nodes.over_capacity():
+            nodes.evict(rootKey)
+
+        if (iterations % EARLY_STOP_INTERVAL == 0 and
+                best_move_decided(root_info_suct(nodes, s, playerIndex), playerActions, remaining_iterations(tStart, iterations, deadline))):
+            break
+
+    rootInfo = root_info_suct(nodes, s, playerIndex)
+
+    logger.debug("SUCT searched %d iterations, %s", iterations, nodes.counters())
+    if metrics.ENABLED:
+        metrics.record_search("suct", iterations, len(nodes), search.maxDepth, nodes.memory_bytes())
+    return rootInfo, iterations
+
+
+def mcts_suct(board: sim.BoardState, playerIndex, maxTime=150, playout=mcts_playout, deadline=None, seed=None):
+    rootInfo, iterations = search_suct(board, playerIndex, maxTime, playout, deadline, seed)
+    return best_move(rootInfo)
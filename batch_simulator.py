@@ -0,0 +1,291 @@
+import numpy as np
+
+from typing import Dict
+
+import simulator as sim
+
+# Vectorised version of simulator.BoardState which holds many boards of the same size as NumPy
+# arrays and steps all of them at once. Squares are stored as integer cells (y * w + x) and moves as
+# indices into sim.MOVES. Each snake occupies a slot (its index in snakeIds) on every board.
+
+# Values returned by BatchBoardState.winners for boards which haven't finished or ended in a draw
+ONGOING = -1
+DRAW = -2
+
+# Distance used for squares which can't be reached (e.g. when there is no food)
+FAR = np.iinfo(np.int32).max
+
+# Bit generators a batch can draw its random numbers from. Philox is counter-based, so a generator
+# can be jumped to any point in its stream without having to be stepped there.
+BIT_GENERATORS = {
+    "pcg64": np.random.PCG64,
+    "philox": np.random.Philox,
+    "sfc64": np.random.SFC64,
+}
+
+
+# Returns a table where table[d, cell] is the cell reached by moving from cell in the direction
+# sim.MOVES[d], or -1 if that is out of bounds
+def neighbour_table(w: int, h: int):
+    cells = np.arange(w * h)
+    xs = cells % w
+    ys = cells // w
+
+    table = np.empty((len(sim.MOVES), w * h), dtype=np.int32)
+    for d, m in enumerate(sim.MOVES):
+        nx = xs + m.x
+        ny = ys + m.y
+        inBounds = (0 <= nx) & (nx < w) & (0 <= ny) & (ny < h)
+        table[d] = np.where(inBounds, ny * w + nx, -1)
+
+    return table
+
+
+# Returns a table of the manhattan distance between every pair of cells
+def distance_table(w: int, h: int):
+    cells = np.arange(w * h)
+    xs = cells % w
+    ys = cells // w
+    return (np.abs(xs[:, None] - xs[None, :]) + np.abs(ys[:, None] - ys[None, :])).astype(np.int32)
+
+
+class BatchBoardState:
+    def __init__(self, w: int, h: int, n: int, snakeIds, minFood=sim.DEFAULT_MIN_FOOD, foodSpawnChance=sim.DEFAULT_FOOD_SPAWN_CHANCE, seed=None, bitGenerator="pcg64"):
+        self.w = w
+        self.h = h
+        self.n = n
+        self.size = w * h
+        self.snakeIds = list(snakeIds)
+        self.minFood = minFood
+        self.foodSpawnChance = foodSpawnChance
+
+        noSnakes = len(self.snakeIds)
+
+        # Each body is a ring buffer starting at the head. A snake can never be longer than the
+        # board plus the stacked segments it starts with, so it never wraps onto itself.
+        self.capacity = self.size + 4
+        self.bodies = np.zeros((n, noSnakes, self.capacity), dtype=np.int32)
+        self.start = np.zeros((n, noSnakes), dtype=np.int64)
+        self.lengths = np.zeros((n, noSnakes), dtype=np.int64)
+
+        self.heads = np.full((n, noSnakes), -1, dtype=np.int64)
+        self.health = np.zeros((n, noSnakes), dtype=np.int64)
+        self.alive = np.zeros((n, noSnakes), dtype=bool)
+
+        self.occupancy = np.zeros((n, self.size), dtype=np.int32)  # snake segments per cell
+        self.food = np.zeros((n, self.size), dtype=bool)
+        self.turn = np.zeros(n, dtype=np.int64)
+
+        self.neighbours = neighbour_table(w, h)
+        self.distances = distance_table(w, h)
+        self.rng = np.random.Generator(BIT_GENERATORS[bitGenerator](seed))
+
+    # Returns the winning slot of each board, ONGOING if it hasn't finished or DRAW if every snake
+    # was eliminated
+    def winners(self):
+        counts = self.alive.sum(1)
+        result = np.full(self.n, ONGOING, dtype=np.int64)
+        result[counts == 0] = DRAW
+
+        finished = counts == 1
+        result[finished] = self.alive[finished].argmax(1)
+        return result
+
+    # Returns the cell of the tip of each snake's tail (the head for snakes of length 1)
+    def tail_tips(self):
+        tipIndex = (self.start + self.lengths - 1) % self.capacity
+        return np.take_along_axis(self.bodies, tipIndex[:, :, None], 2)[:, :, 0]
+
+    # Returns an (n, #snakes, 4) array of the cells next to each head, or -1 for out of bounds
+    def next_cells(self):
+        heads = np.where(self.alive, self.heads, 0)
+        return np.moveaxis(self.neighbours[:, heads], 0, 2)
+
+    # Moves the head of each snake on the unfinished boards. moves is an (n, #snakes) array of
+    # indices into sim.MOVES. Follows the same rules as BoardState.step.
+    def step(self, moves):
+        active = self.winners() == ONGOING
+        movers = self.alive & active[:, None]
+
+        self.move_snakes(movers, moves)
+        self.feed_snakes(movers)
+        self.spawn_food(active)
+        self.eliminate_snakes(movers)
+
+        self.turn[active] += 1
+
+    def move_snakes(self, movers, moves):
+        ns, ss = np.nonzero(movers)
+        newHeads = self.neighbours[moves[ns, ss], self.heads[ns, ss]]
+
+        self.heads[ns, ss] = newHeads
+        self.start[ns, ss] = (self.start[ns, ss] - 1) % self.capacity
+        self.bodies[ns, ss, self.start[ns, ss]] = newHeads
+        self.lengths[ns, ss] += 1
+        self.health[ns, ss] -= 1
+
+        inBounds = newHeads >= 0
+        np.add.at(self.occupancy, (ns[inBounds], newHeads[inBounds]), 1)
+
+    def feed_snakes(self, movers):
+        ns, ss = np.nonzero(movers)
+        heads = self.heads[ns, ss]
+
+        ate = (heads >= 0) & self.food[ns, np.maximum(heads, 0)]
+        self.health[ns[ate], ss[ate]] = sim.SNAKE_MAX_HEALTH
+        self.food[ns[ate], heads[ate]] = False
+
+        # Snakes which didn't eat lose the tip of their tail
+        ns = ns[~ate]
+        ss = ss[~ate]
+        tipIndex = (self.start[ns, ss] + self.lengths[ns, ss] - 1) % self.capacity
+        tips = self.bodies[ns, ss, tipIndex]
+        self.lengths[ns, ss] -= 1
+        np.add.at(self.occupancy, (ns, tips), -1)
+
+    def spawn_food(self, active):
+        # Like BoardState.randomly_place_food, nothing is placed when the spawn chance is 0
+        if self.foodSpawnChance == 0:
+            return
+
+        counts = self.food.sum(1)
+        needed = np.where(counts < self.minFood, self.minFood - counts, 0)
+        chance = (needed == 0) & (self.rng.integers(100, size=self.n) < self.foodSpawnChance)
+        needed[chance] = 1
+        needed[~active] = 0
+
+        for i in range(needed.max(initial=0)):
+            empty = (self.occupancy == 0) & ~self.food
+
+            # Picking the largest of a random key per square chooses uniformly between the empty ones
+            keys = self.rng.random((self.n, self.size))
+            keys[~empty] = -1.0
+            cells = keys.argmax(1)
+
+            place = (needed > i) & empty.any(1)
+            self.food[place, cells[place]] = True
+
+    def eliminate_snakes(self, movers):
+        heads = self.heads
+        outOfBounds = heads < 0
+
+        sameHead = (heads[:, :, None] == heads[:, None, :]) & movers[:, :, None] & movers[:, None, :]
+        headCounts = sameHead.sum(2)
+
+        # Any segments in a head's square other than heads must belong to a tail
+        segments = np.take_along_axis(self.occupancy, np.maximum(heads, 0), 1)
+        hitTail = segments > headCounts
+
+        sameHead &= ~np.eye(len(self.snakeIds), dtype=bool)[None, :, :]
+        lostHeadToHead = (sameHead & (self.lengths[:, :, None] <= self.lengths[:, None, :])).any(2)
+
+        dead = movers & (outOfBounds | (self.health <= 0) | hitTail | lostHeadToHead)
+
+        ns, ss = np.nonzero(dead)
+        if len(ns) > 0:
+            offsets = np.arange(self.capacity)
+            cells = self.bodies[ns[:, None], ss[:, None], (self.start[ns, ss][:, None] + offsets) % self.capacity]
+            inBody = (offsets[None, :] < self.lengths[ns, ss][:, None]) & (cells >= 0)
+            rows = np.broadcast_to(ns[:, None], cells.shape)
+            np.add.at(self.occupancy, (rows[inBody], cells[inBody]), -1)
+
+        self.alive &= ~dead
+
+
+# Creates a batch of n copies of board
+def batch_from_board(board: sim.BoardState, n: int, seed=None, bitGenerator="pcg64"):
+    b = BatchBoardState(board.w, board.h, n, board.snakes, board.minFood, board.foodSpawnChance, seed, bitGenerator)
+
+    for i, snake in enumerate(board.snakes.values()):
+        cells = [snake.head] + list(snake.tail)
+        b.bodies[:, i, :len(cells)] = cells
+        b.lengths[:, i] = len(cells)
+        b.heads[:, i] = cells[0]
+        b.health[:, i] = snake.health
+        b.alive[:, i] = True
+        np.add.at(b.occupancy, (slice(None), cells), 1)
+
+    for f in board.food:
+        b.food[:, f] = True
+
+    b.turn[:] = board.turn
+    return b
+
+
+# ----- Policies -----#
+
+# Batched version of ai.avoid_oob_and_snakes for every snake. Returns an (n, #snakes, 4) mask of
+# the moves which don't go out of bounds or into a snake, treating the tips of tails as free.
+def safe_moves(b: BatchBoardState):
+    nextCells = b.next_cells()
+    inBounds = nextCells >= 0
+    cells = np.maximum(nextCells, 0)
+
+    segments = np.take_along_axis(b.occupancy, cells.reshape(b.n, -1), 1).reshape(cells.shape)
+
+    hasTail = b.alive & (b.lengths > 1)
+    tips = b.tail_tips()
+    tipsInCell = ((cells[:, :, :, None] == tips[:, None, None, :]) & hasTail[:, None, None, :]).sum(3)
+
+    return inBounds & (segments - tipsInCell <= 0) & b.alive[:, :, None]
+
+
+# Picks a random move out of the ones allowed by mask for each snake, or UP if none are
+def random_moves(b: BatchBoardState, mask):
+    keys = b.rng.random(mask.shape)
+    keys[~mask] = -1.0
+    return keys.argmax(2)
+
+
+def batch_safe_player(b: BatchBoardState, safe=None):
+    if safe is None:
+        safe = safe_moves(b)
+
+    return random_moves(b, safe)
+
+
+# Batched version of ai.chase_food. Moves each snake towards the closest food, falling back to
+# batch_safe_player on boards without any food.
+def batch_chase_food(b: BatchBoardState, safe=None):
+    if safe is None:
+        safe = safe_moves(b)
+
+    heads = np.where(b.alive, b.heads, 0)
+    foodDistances = np.where(b.food[:, None, :], b.distances[heads], FAR)
+    closestFood = foodDistances.argmin(2)
+
+    nextCells = b.next_cells()
+    moveDistances = b.distances[closestFood[:, :, None], np.maximum(nextCells, 0)]
+    moveDistances = np.where(safe, moveDistances, FAR)
+    moves = moveDistances.argmin(2)  # UP if no moves are safe
+
+    hasFood = b.food.any(1)
+    return np.where(hasFood[:, None], moves, batch_safe_player(b, safe))
+
+
+# Batched version of ai.simple_player
+def batch_simple_player(b: BatchBoardState):
+    safe = safe_moves(b)
+    useSafe = b.rng.random(b.alive.shape) < 0.10
+    return np.where(useSafe, batch_safe_player(b, safe), batch_chase_food(b, safe))
+
+
+# Plays out n games from board at once with batch_simple_player and returns the average reward of
+# each snake. Games still going after maxTurns are won by the longest snake, as in ai.mcts_playout.
+# The same seed and bitGenerator always give the same rewards.
+def batch_playout(board: sim.BoardState, n: int, maxTurns=50, seed=None, bitGenerator="pcg64") -> Dict[object, float]:
+    b = batch_from_board(board, n, seed, bitGenerator)
+    for i in range(maxTurns):
+        if not (b.winners() == ONGOING).any():
+            break
+        b.step(batch_simple_player(b))
+
+    winners = b.winners()
+    longest = np.where(b.alive, b.lengths, -1).argmax(1)
+    winners = np.where(winners == ONGOING, longest, winners)
+
+    slots = np.arange(len(b.snakeIds))
+    rewards = np.where(winners[:, None] == slots[None, :], 1.0, np.where(winners[:, None] == DRAW, 0.0, -1.0))
+    means = rewards.mean(0)
+
+    return {k: float(means[i]) for i, k in enumerate(b.snakeIds)}
@@ -0,0 +1,78 @@
+import random as rd
+
+import pytest
+
+# The batched simulator is optional and needs numpy
+np = pytest.importorskip("numpy")
+
+import simulator as sim
+import batch_simulator as bsim
+import ai
+import server_logic
+
+def assert_same(board: sim.BoardState, b: bsim.BatchBoardState, i: int):
+  for slot, k in enumerate(b.snakeIds):
+    assert b.alive[i, slot] == (k in board.snakes)
+    if k in board.snakes:
+      snake = board.snakes[k]
+      assert b.heads[i, slot] == snake.head
+      assert b.lengths[i, slot] == snake.length()
+      assert b.health[i, slot] == snake.health
+
+  assert set(np.nonzero(b.food[i])[0]) == board.food
+  assert list(b.occupancy[i]) == board.occupancy
+
+def test_step_matches_simulator():
+  rd.seed(4)
+  for game in range(30):
+    board = sim.generate_board(7, 7, 4, minFood=3)
+    board.foodSpawnChance = 0
+    b = bsim.batch_from_board(board, 2)
+
+    while board.winner() == -1:
+      moves = {k: sim.MOVES[rd.randrange(len(sim.MOVES))] for k in board.snakes}
+      indices = np.array([[sim.MOVES.index(moves.get(k, sim.UP)) for k in b.snakeIds]] * 2)
+      board.step(moves)
+      b.step(indices)
+
+      assert_same(board, b, 0)
+      assert_same(board, b, 1)
+
+    winner = board.winner()
+    expected = bsim.DRAW if winner is None else b.snakeIds.index(winner)
+    assert list(b.winners()) == [expected, expected]
+
+def test_safe_moves_match_avoid_oob_and_snakes():
+  rd.seed(5)
+  for game in range(30):
+    board = sim.generate_board(7, 7, 3)
+    while board.winner() == -1:
+      b = bsim.batch_from_board(board, 1)
+      safe = bsim.safe_moves(b)
+      for slot, k in enumerate(b.snakeIds):
+        expected = ai.avoid_oob_and_snakes(board, sim.MOVES, board.snakes[k].head)
+        assert [sim.MOVES[d] for d in range(len(sim.MOVES)) if safe[0, slot, d]] == expected
+
+      board.step({k: ai.simple_player(board, k) for k in board.snakes})
+
+def test_playout_rewards_are_averages():
+  rd.seed(6)
+  board = sim.generate_board(11, 11, 2)
+  rewards = bsim.batch_playout(board, 64, seed=0)
+  assert set(rewards) == set(board.snakes)
+  assert all(-1.0 <= r <= 1.0 for r in rewards.values())
+
+def test_playout_is_repeatable_for_every_bit_generator():
+  board = sim.generate_board(11, 11, 3, rng=rd.Random(8))
+  for bitGenerator in bsim.BIT_GENERATORS:
+    first = bsim.batch_playout(board, 32, seed=1, bitGenerator=bitGenerator)
+    assert bsim.batch_playout(board, 32, seed=1, bitGenerator=bitGenerator) == first
+
+def test_mcts_playout_batched_uses_rollouts():
+  board = sim.generate_board(11, 11, 3, rng=rd.Random(9))
+  rewards = ai.mcts_playout_batched(board, rollouts=1)
+  assert set(rewards) == set(board.snakes)
+  assert all(r in (-1.0, 0.0, 1.0) for r in rewards.values())
+
+def test_batched_playout_is_registered():
+  assert server_logic.PLAYOUTS["batched"] is ai.mcts_playout_batched
@@ -0,0 +1,87 @@
+"""
+Load test for a locally running server. Plays several simulated games at once, sending /start,
+/move and /end requests for each, and reports the throughput and latency of the /move requests.
+
+Start the server first, e.g.
+
+    python server.py --production
+
+then run from the root of the repository with:
+
+    python -m benchmarks.load --games 8
+"""
+import argparse
+import http.client
+import json
+import random as rd
+import statistics
+import threading
+import time
+
+import simulator as sim
+import ai
+import server_logic
+
+
+def post(conn: http.client.HTTPConnection, path: str, data: dict):
+    conn.request("POST", path, json.dumps(data), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    return response.read()
+
+
+def play_game(host: str, port: int, gameId: str, turns: int, seed: int, latencies: list):
+    board = sim.generate_board(11, 11, 2, rng=rd.Random(seed))
+    you = next(iter(board.snakes))
+    directions = {server_logic.convert_direction(m): m for m in sim.MOVES}
+    conn = http.client.HTTPConnection(host, port)
+
+    data = server_logic.convert_to_request(board, gameId, you)
+    post(conn, "/start", data)
+    while board.winner() == -1 and you in board.snakes and board.turn < turns:
+        data = server_logic.convert_to_request(board, gameId, you)
+        tStart = time.perf_counter()
+        response = post(conn, "/move", data)
+        latencies.append(time.perf_counter() - tStart)
+
+        # Our snake makes the move the server picked and the others are moved by safe_player
+        moves = {k: ai.safe_player(board, k) for k in board.snakes}
+        moves[you] = directions[json.loads(response)["move"]]
+        board.step(moves)
+
+    # Our snake may have been eliminated, so /end is sent with the last request it was still in
+    post(conn, "/end", data)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--games", type=int, default=4, help="number of games played at once")
+    parser.add_argument("--turns", type=int, default=20, help="maximum turns per game")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    latencies = []
+    threads = [
+        threading.Thread(target=play_game, args=(args.host, args.port, f"load-{i}", args.turns, args.seed + i, latencies))
+        for i in range(args.games)
+    ]
+
+    tStart = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - tStart
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000
+    print(f"moves:      {len(latencies)}")
+    print(f"throughput: {len(latencies) / elapsed:.2f} moves/s")
+    print(f"latency:    mean {statistics.mean(latencies) * 1000:.1f} ms, p50 {percentile(0.5):.1f} ms, "
+          f"p95 {percentile(0.95):.1f} ms, p99 {percentile(0.99):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
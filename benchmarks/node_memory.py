@@ -0,0 +1,86 @@
+"""
+Compares the memory used by DUCT node statistics in ai.DuctTree with the object per node layout it
+replaced (a Node holding a dict of RewardInfo objects for every move of every snake).
+
+For each layout it reports the bytes allocated per node, the time taken to add the nodes and the time
+taken by a full garbage collection with the nodes alive.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.node_memory
+"""
+import argparse
+import gc
+import random as rd
+import time
+import tracemalloc
+
+from dataclasses import dataclass, field
+from typing import Dict
+
+import simulator as sim
+import ai
+
+
+# The layout used before ai.DuctTree
+@dataclass
+class ObjectNode:
+    visitCount: int
+    rewardInfo: Dict[object, Dict[sim.Direction, ai.RewardInfo]]
+    children: Dict[tuple, int] = field(default_factory=dict)
+    unexpanded: object = None
+
+
+def add_object_node(nodes: dict, s: sim.BoardState):
+    nodes[hash(s)] = ObjectNode(0, {k: {m: ai.RewardInfo(0, 0) for m in sim.MOVES} for k in s.snakes})
+
+
+def add_tree_node(nodes: ai.DuctTree, s: sim.BoardState):
+    nodes.add(s)
+
+
+# Adds n nodes to nodes (using the turn to give each a different key) and returns the bytes
+# allocated, the time taken to add them and the time taken by a garbage collection afterwards
+def measure(nodes, add, board: sim.BoardState, n: int):
+    gc.collect()
+    tracemalloc.start()
+    tStart = time.perf_counter()
+    for t in range(n):
+        board.turn = t
+        add(nodes, board)
+    addTime = time.perf_counter() - tStart
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tStart = time.perf_counter()
+    gc.collect()
+    gcTime = time.perf_counter() - tStart
+
+    return allocated, addTime, gcTime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snakes", type=int, default=4)
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rd.seed(args.seed)
+    board = sim.generate_board(11, 11, args.snakes)
+    n = args.nodes
+
+    # Generate the Zobrist keys for every turn up front so they aren't counted
+    for t in range(n):
+        board.turn = t
+        hash(board)
+
+    print(f"{n} nodes, {args.snakes} snakes")
+    print(f"{'layout':>8} {'bytes/node':>12} {'add (ms)':>10} {'gc (ms)':>10}")
+    for name, layout, add in [("objects", dict, add_object_node), ("arrays", ai.DuctTree, add_tree_node)]:
+        allocated, addTime, gcTime = measure(layout(), add, board, n)
+        print(f"{name:>8} {allocated / n:>12.1f} {addTime * 1000:>10.1f} {gcTime * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
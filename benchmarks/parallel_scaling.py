@@ -0,0 +1,64 @@
+"""
+Measures the search rate of the parallel searches against the number of worker processes.
+
+For root parallelism the rate is the total number of iterations run by all of the workers. For leaf
+parallelism it is the number of playouts (iterations x workers).
+
+Run from the root of the repository with:
+
+    python -m benchmarks.parallel_scaling
+"""
+import argparse
+import os
+import random as rd
+import time
+
+import simulator as sim
+import ai
+import parallel
+
+
+def measure_root(board: sim.BoardState, workers: int, searchTime: int, searches: int):
+    iterations = 0
+    tStart = time.perf_counter()
+    for i in range(searches):
+        rootInfo, searchIterations = parallel.search_duct_root_parallel(board, searchTime, workers)
+        iterations += searchIterations
+
+    return iterations / (time.perf_counter() - tStart)
+
+
+def measure_leaf(board: sim.BoardState, workers: int, searchTime: int, searches: int):
+    iterations = 0
+    playout = lambda s: parallel.mcts_playout_leaf_parallel(s, workers)
+    tStart = time.perf_counter()
+    for i in range(searches):
+        rootInfo, searchIterations = ai.search_duct(board, searchTime, playout)
+        iterations += searchIterations
+
+    return iterations * workers / (time.perf_counter() - tStart)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--search-time", type=int, default=200, help="time per search in ms")
+    parser.add_argument("--searches", type=int, default=10, help="searches per worker count")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rd.seed(args.seed)
+    board = sim.generate_board(11, 11, 2)
+
+    print(f"{'workers':>8} {'root it/s':>12} {'leaf playouts/s':>16}")
+    for workers in range(1, args.max_workers + 1):
+        parallel.start_pool(workers)
+        root = measure_root(board, workers, args.search_time, args.searches)
+        leaf = measure_leaf(board, workers, args.search_time, args.searches)
+        print(f"{workers:>8} {root:>12.1f} {leaf:>16.1f}")
+
+    parallel.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
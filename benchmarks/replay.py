@@ -0,0 +1,219 @@
+"""
+Replays requests recorded by the server (see recorder.py) and reports, for every /move request, how
+long it took, how many iterations the search ran and how many nodes it added to the tree, and
+whether the move chosen differs from the one sent back when the game was recorded.
+
+Requests are sent either straight to server_logic in this process or, with --url, to a running
+server (which doesn't report search statistics). By default the games are replayed one after
+another, each as fast as the answers come back, so the latencies don't include any contention
+between games. With --speed recorded each game is replayed in its own thread with its requests
+spaced out as they were when recorded, so games which overlapped then overlap again.
+
+Record games by starting the server with BATTLESNAKE_RECORD set, e.g.
+
+    BATTLESNAKE_RECORD=games.jsonl python server.py --production
+
+then run from the root of the repository with:
+
+    python -m benchmarks.replay games.jsonl --csv turns.csv
+"""
+import argparse
+import csv
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+import recorder
+import server_logic
+import sessions
+import tournament
+
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+@dataclass
+class TurnResult:
+    gameId: str
+    turn: int
+    latencyMs: float
+    iterations: Optional[int]
+    nodesAdded: Optional[int]
+    recordedMove: Optional[str]
+    move: str
+
+    @property
+    def changed(self):
+        return self.recordedMove is not None and self.move != self.recordedMove
+
+
+# Sends requests to server_logic in this process
+class LocalTarget:
+    def start(self, data: dict):
+        server_logic.start_game(data)
+
+    # Returns the move chosen, the number of iterations the search ran and the number of nodes it
+    # added to the game's tree (None when the search is spread over worker processes)
+    def move(self, data: dict):
+        requestStart = time.perf_counter()
+        move = server_logic.choose_move(data, requestStart)
+        server_logic.finish_move(data["game"]["id"])
+
+        session = sessions.get_session(data["game"]["id"])
+        return move, session.iterations, session.nodesAdded
+
+    def end(self, data: dict):
+        server_logic.end_game(data)
+
+
+# Sends requests to a running server
+class HttpTarget:
+    def __init__(self, url: str):
+        url = urllib.parse.urlsplit(url)
+        self.conn = http.client.HTTPConnection(url.hostname, url.port or 80)
+
+    def post(self, path: str, data: dict):
+        self.conn.request("POST", path, json.dumps(data), {"Content-Type": "application/json"})
+        return self.conn.getresponse().read()
+
+    def start(self, data: dict):
+        self.post("/start", data)
+
+    def move(self, data: dict):
+        return json.loads(self.post("/move", data))["move"], None, None
+
+    def end(self, data: dict):
+        self.post("/end", data)
+
+
+# Splits the entries of a log into the entries of each game, in the order the games started
+def split_games(entries: List[dict]):
+    games = {}
+    for entry in entries:
+        games.setdefault(entry["data"]["game"]["id"], []).append(entry)
+
+    return list(games.values())
+
+
+# Sends the entries of one game to target. With a clock (the time each entry's time in the log
+# corresponds to in time.perf_counter() values), each request waits until its time comes.
+def replay_game(entries: List[dict], target, results: List[TurnResult], clock=None):
+    for entry in entries:
+        if clock is not None:
+            wait = clock(entry["time"]) - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        data = entry["data"]
+        if entry["path"] == "/start":
+            target.start(data)
+        elif entry["path"] == "/end":
+            target.end(data)
+        elif entry["path"] == "/move":
+            tStart = time.perf_counter()
+            move, iterations, nodesAdded = target.move(data)
+            latencyMs = (time.perf_counter() - tStart) * 1000
+            results.append(TurnResult(data["game"]["id"], data["turn"], latencyMs, iterations, nodesAdded, entry.get("move"), move))
+
+
+# Replays entries, sending each game's requests to a target made by new_target (see the top of the
+# file for the speeds)
+def replay(entries: List[dict], new_target, speed="max"):
+    games = split_games(entries)
+    results = []
+    if speed != "recorded":
+        for game in games:
+            replay_game(game, new_target(), results)
+        return results
+
+    logStart = min(entry["time"] for entry in entries)
+    replayStart = time.perf_counter()
+    clock = lambda t: replayStart + (t - logStart)
+    gameResults = [[] for game in games]
+    threads = [
+        threading.Thread(target=replay_game, args=(game, new_target(), gameResult, clock))
+        for game, gameResult in zip(games, gameResults)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return [r for gameResult in gameResults for r in gameResult]
+
+
+def mean(xs: List[float]):
+    return sum(xs) / len(xs) if xs else None
+
+
+def summarise(results: List[TurnResult]):
+    latencies = [r.latencyMs for r in results]
+    return {
+        "moves": len(results),
+        "games": len({r.gameId for r in results}),
+        "changed": sum(r.changed for r in results),
+        "meanMs": mean(latencies),
+        **{f"p{q}Ms": tournament.percentile(latencies, q) for q in LATENCY_PERCENTILES},
+        "maxMs": max(latencies, default=None),
+        "meanIterations": mean([r.iterations for r in results if r.iterations is not None]),
+        "meanNodesAdded": mean([r.nodesAdded for r in results if r.nodesAdded is not None]),
+    }
+
+
+def write_csv(results: List[TurnResult], path: str):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["gameId", "turn", "latencyMs", "iterations", "nodesAdded", "recordedMove", "move", "changed"])
+        for r in results:
+            writer.writerow([r.gameId, r.turn, f"{r.latencyMs:.2f}", r.iterations, r.nodesAdded, r.recordedMove, r.move, r.changed])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="JSONL file written by the server with BATTLESNAKE_RECORD set")
+    parser.add_argument("--speed", choices=["max", "recorded"], default="max")
+    parser.add_argument("--url", help="send the requests to the server at this URL instead of this process")
+    parser.add_argument("--turns", action="store_true", help="print a line for every /move request")
+    parser.add_argument("--json", help="file to save the summary and every turn to")
+    parser.add_argument("--csv", help="file to save every turn to")
+    args = parser.parse_args()
+
+    new_target = (lambda: HttpTarget(args.url)) if args.url else LocalTarget
+    if not args.url:
+        server_logic.warm_up()
+
+    results = replay(recorder.read_log(args.log), new_target, args.speed)
+    summary = summarise(results)
+
+    if args.turns:
+        for r in results:
+            iterations = "-" if r.iterations is None else r.iterations
+            nodesAdded = "-" if r.nodesAdded is None else r.nodesAdded
+            flag = " changed" if r.changed else ""
+            print(f"{r.gameId} {r.turn:>4} {r.latencyMs:8.1f} ms {iterations:>7} iterations {nodesAdded:>7} nodes added "
+                  f"{r.recordedMove} -> {r.move}{flag}")
+
+    print(f"{summary['moves']} moves in {summary['games']} games, {summary['changed']} changed")
+    if args.speed != "recorded":
+        print("games were replayed one after another, so latencies don't include contention between games")
+    if results:
+        percentiles = " ".join(f"p{q} {summary[f'p{q}Ms']:.1f}" for q in LATENCY_PERCENTILES)
+        print(f"latency (ms): mean {summary['meanMs']:.1f} {percentiles} max {summary['maxMs']:.1f}")
+    if summary["meanIterations"] is not None:
+        print(f"mean iterations: {summary['meanIterations']:.0f}")
+    if summary["meanNodesAdded"] is not None:
+        print(f"mean nodes added: {summary['meanNodesAdded']:.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "turns": [{**asdict(r), "changed": r.changed} for r in results]}, f, indent=2)
+    if args.csv:
+        write_csv(results, args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Benchmark suite for the simulator and searches, run over a fixed corpus of seeded positions so that
+results from two commits can be compared.
+
+Measures, for 7x7, 11x11 and 19x19 boards with 2-4 snakes:
+  - step:      BoardState.step calls per second replaying a recorded game
+  - playout:   ai.mcts_playout calls per second
+  - duct/suct: iterations and nodes added per second for a fixed number of search iterations, and
+               the bytes allocated per node
+and the end-to-end latency of /move requests sent to the Flask app in this process. Each rate is
+the best of a few rounds.
+
+Searches run a fixed number of iterations rather than for a fixed time, so the trees built (and
+the work done) are the same on every run from the same seed.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.suite run --output before.json
+    ... change things ...
+    python -m benchmarks.suite run --output after.json
+    python -m benchmarks.suite compare before.json after.json
+"""
+import argparse
+import copy
+import gc
+import json
+import platform
+import random as rd
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from dataclasses import dataclass
+
+import simulator as sim
+import ai
+import server_logic
+
+BOARD_SIZES = [7, 11, 19]
+SNAKE_COUNTS = [2, 3, 4]
+
+# Positions are taken this many turns into a seeded simple_player game (or earlier if it ends)
+POSITION_TURN = 10
+
+# Changes smaller than this (as a fraction) are reported as noise by compare
+DEFAULT_THRESHOLD = 0.05
+
+# Metrics where a smaller value is better
+LOWER_IS_BETTER = {"bytesPerNode", "meanMs", "p50Ms", "maxMs"}
+
+# Metrics which describe the work done rather than how fast it was done
+UNCOMPARED = {"nodes", "moves"}
+
+
+@dataclass
+class Position:
+    name: str
+    board: sim.BoardState
+
+
+# Returns the corpus of positions, which depends only on seed
+def corpus(seed=0):
+    positions = []
+    for size in BOARD_SIZES:
+        for noSnakes in SNAKE_COUNTS:
+            rng = rd.Random(f"{seed}:{size}:{noSnakes}")
+            board = sim.generate_board(size, size, noSnakes, rng=rng)
+            while board.turn < POSITION_TURN:
+                nextBoard = copy.deepcopy(board)
+                nextBoard.step({k: ai.simple_player(nextBoard, k) for k in nextBoard.snakes})
+                if nextBoard.winner() != -1:
+                    break
+                board = nextBoard
+
+            positions.append(Position(f"{size}x{size}-{noSnakes}", board))
+
+    return positions
+
+
+# Plays board out with simple_player (from a copy seeded with seed) and returns the moves made
+def record_game(board: sim.BoardState, seed: int):
+    board = copy.deepcopy(board)
+    board.rng = rd.Random(seed)
+    history = []
+    while board.winner() == -1:
+        moves = {k: ai.simple_player(board, k) for k in board.snakes}
+        history.append(moves)
+        board.step(moves)
+
+    return history
+
+
+def measure_step(position: Position, repeats: int):
+    history = record_game(position.board, 0)
+
+    # Only the steps are timed. Each repeat starts from a fresh copy since undoing the steps can
+    # leave the empty squares in a different order, which would change where food spawns.
+    steps = 0
+    elapsed = 0.0
+    for i in range(repeats):
+        board = copy.deepcopy(position.board)
+        board.rng = rd.Random(0)
+        tStart = time.perf_counter()
+        for moves in history:
+            board.step(moves)
+        elapsed += time.perf_counter() - tStart
+        steps += len(history)
+
+    return {"stepsPerSecond": steps / elapsed}
+
+
+def measure_playout(position: Position, playouts: int):
+    s = copy.deepcopy(position.board)
+    s.foodSpawnChance = 0
+    s.rng = rd.Random(0)
+
+    tStart = time.perf_counter()
+    for i in range(playouts):
+        ai.mcts_playout(s)
+
+    return {"playoutsPerSecond": playouts / (time.perf_counter() - tStart)}
+
+
+# Returns the tree, root state and iteration function for a search of position
+def new_search(search: str, position: Position):
+    s = copy.deepcopy(position.board)
+    s.foodSpawnChance = 0
+    s.rng = rd.Random(0)
+
+    if search == "duct":
+        nodes = ai.DuctTree()
+        ai.add_node_duct(nodes, s)
+        return nodes, s, ai.mcts_duct_iter
+    else:
+        s = ai.StateSUCT(s, list(s.snakes))
+        nodes = ai.TreeSUCT()
+        ai.add_node_suct(nodes, s)
+        return nodes, s, ai.mcts_iter_suct
+
+
+def measure_search(search: str, position: Position, iterations: int):
+    nodes, s, iterate = new_search(search, position)
+    gc.collect()
+    tStart = time.perf_counter()
+    for i in range(iterations):
+        iterate(nodes, s)
+    elapsed = time.perf_counter() - tStart
+
+    return {"iterationsPerSecond": iterations / elapsed, "nodesPerSecond": len(nodes) / elapsed}
+
+
+# Measured separately from the search rates since tracing allocations slows everything down
+def measure_search_memory(search: str, position: Position, iterations: int):
+    nodes, s, iterate = new_search(search, position)
+    gc.collect()
+    tracemalloc.start()
+    for i in range(iterations):
+        iterate(nodes, s)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {"nodes": len(nodes), "bytesPerNode": allocated / len(nodes)}
+
+
+# Runs measure rounds times and keeps the best value of each metric, which is much less affected by
+# whatever else the machine is doing than the mean
+def best_of(rounds: int, measure, *args):
+    best = measure(*args)
+    for i in range(rounds - 1):
+        for metric, value in measure(*args).items():
+            best[metric] = min(best[metric], value) if metric in LOWER_IS_BETTER else max(best[metric], value)
+
+    return best
+
+
+# Plays a game of requests against the Flask app, with the other snakes moved by safe_player, and
+# returns the latency (ms) of every /move request
+def measure_move_latency(position: Position, turns: int, timeout: int):
+    import server  # imported here so the other benchmarks run without Flask
+
+    client = server.app.test_client()
+    directions = {server_logic.convert_direction(m): m for m in sim.MOVES}
+    board = copy.deepcopy(position.board)
+    board.rng = rd.Random(0)
+    you = next(iter(board.snakes))
+    gameId = f"benchmark-{position.name}"
+
+    latencies = []
+    data = server_logic.convert_to_request(board, gameId, you, timeout)
+    client.post("/start", json=data)
+    while board.winner() == -1 and you in board.snakes and len(latencies) < turns:
+        data = server_logic.convert_to_request(board, gameId, you, timeout)
+        tStart = time.perf_counter()
+        response = client.post("/move", json=data)
+        latencies.append((time.perf_counter() - tStart) * 1000)
+
+        moves = {k: ai.safe_player(board, k) for k in board.snakes}
+        moves[you] = directions[response.get_json()["move"]]
+        board.step(moves)
+
+    # Our snake may have been eliminated, so /end is sent with the last request it was still in
+    client.post("/end", json=data)
+
+    latencies.sort()
+    return {
+        "moves": len(latencies),
+        "meanMs": sum(latencies) / len(latencies),
+        "p50Ms": latencies[len(latencies) // 2],
+        "maxMs": latencies[-1],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    positions = corpus(args.seed)
+    results = {"step": {}, "playout": {}, "duct": {}, "suct": {}, "move": {}}
+
+    for position in positions:
+        print(f"{position.name}...", file=sys.stderr)
+        results["step"][position.name] = best_of(args.rounds, measure_step, position, args.repeats)
+        results["playout"][position.name] = best_of(args.rounds, measure_playout, position, args.playouts)
+        for search in ["duct", "suct"]:
+            results[search][position.name] = {
+                **best_of(args.rounds, measure_search, search, position, args.iterations),
+                **measure_search_memory(search, position, args.iterations),
+            }
+
+    if not args.skip_move:
+        for position in positions:
+            results["move"][position.name] = measure_move_latency(position, args.move_turns, args.move_timeout)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "settings": {k: getattr(args, k) for k in ["rounds", "repeats", "playouts", "iterations", "move_turns", "move_timeout"]},
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    if before["seed"] != after["seed"] or before["settings"] != after["settings"]:
+        print("warning: the runs used different seeds or settings", file=sys.stderr)
+
+    print(f"{'benchmark':<10} {'position':<10} {'metric':<20} {'before':>12} {'after':>12} {'change':>8}")
+    regressions = 0
+    for benchmark, positions in before["results"].items():
+        for name, metrics in positions.items():
+            afterMetrics = after["results"].get(benchmark, {}).get(name, {})
+            for metric, value in metrics.items():
+                if metric in UNCOMPARED or metric not in afterMetrics or not value:
+                    continue
+
+                change = afterMetrics[metric] / value - 1
+                worse = change > args.threshold if metric in LOWER_IS_BETTER else change < -args.threshold
+                regressions += worse
+                flag = " !" if worse else ""
+                print(f"{benchmark:<10} {name:<10} {metric:<20} {value:>12.1f} {afterMetrics[metric]:>12.1f} {change:>+8.1%}{flag}")
+
+    print(f"{regressions} regressions beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    runParser = commands.add_parser("run", help="run the benchmarks")
+    runParser.add_argument("--seed", type=int, default=0)
+    runParser.add_argument("--rounds", type=int, default=3, help="times each measurement is taken (the best is kept)")
+    runParser.add_argument("--repeats", type=int, default=20, help="times each recorded game is replayed")
+    runParser.add_argument("--playouts", type=int, default=200, help="playouts per position")
+    runParser.add_argument("--iterations", type=int, default=1000, help="search iterations per position")
+    runParser.add_argument("--move-turns", type=int, default=20, help="/move requests per position")
+    runParser.add_argument("--move-timeout", type=int, default=200, help="game timeout in ms sent with /move")
+    runParser.add_argument("--skip-move", action="store_true", help="skip the /move latency benchmark")
+    runParser.add_argument("--output", help="file to save the results to (stdout by default)")
+
+    compareParser = commands.add_parser("compare", help="compare two saved runs")
+    compareParser.add_argument("before")
+    compareParser.add_argument("after")
+    compareParser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures how the MCTS iteration rate changes as the search tree grows.
+
+With a constant hash every lookup in the tree degenerates into a scan of all of the nodes, so the
+iteration rate falls as the tree gets bigger. With a proper hash it should stay roughly flat.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.tree_growth
+"""
+import argparse
+import random as rd
+import time
+
+import simulator as sim
+import ai
+
+
+def measure(search: str, windows: int, windowTime: float, seed: int):
+    rd.seed(seed)
+    board = sim.generate_board(11, 11, 2)
+    board.foodSpawnChance = 0
+
+    if search == "duct":
+        s = board
+        nodes = ai.DuctTree()
+        ai.add_node_duct(nodes, s)
+        iterate = ai.mcts_duct_iter
+    else:
+        s = ai.StateSUCT(board, list(board.snakes))
+        nodes = ai.TreeSUCT()
+        ai.add_node_suct(nodes, s)
+        iterate = ai.mcts_iter_suct
+
+    results = []
+    for i in range(windows):
+        iterations = 0
+        tStart = time.perf_counter()
+        while time.perf_counter() - tStart < windowTime:
+            iterate(nodes, s)
+            iterations += 1
+        elapsed = time.perf_counter() - tStart
+
+        results.append((len(nodes), iterations / elapsed))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--search", choices=["duct", "suct"], default="duct")
+    parser.add_argument("--windows", type=int, default=10, help="number of measurement windows")
+    parser.add_argument("--window-time", type=float, default=1.0, help="length of each window in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>10} {'iterations/s':>14}")
+    for noNodes, rate in measure(args.search, args.windows, args.window_time, args.seed):
+        print(f"{noNodes:>10} {rate:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import math
+import os
+from typing import Dict
+
+import simulator as sim
+
+# Static evaluation of unfinished games, used to score the leaves of the search instead of (or at
+# the end of a shorter) random playout. Each snake's position is scored on:
+#   - territory: the share of the reachable squares it can get to before any other snake, found with
+#     a breadth first search from every head at once (a Voronoi partition of the free squares)
+#   - length: its share of the total length of the snakes still on the board
+#   - food: once it is getting hungry, whether it can reach food that it gets to first before its
+#     health runs out
+# and the rewards are squashed into [-1, 1] from how far each snake's score is ahead of the others'.
+
+TERRITORY_WEIGHT = float(os.environ.get("BATTLESNAKE_EVAL_TERRITORY", "1.0"))
+LENGTH_WEIGHT = float(os.environ.get("BATTLESNAKE_EVAL_LENGTH", "0.5"))
+STARVING_PENALTY = float(os.environ.get("BATTLESNAKE_EVAL_STARVING", "0.5"))
+
+# Health below which a snake with no food it can get to in time is penalised
+HUNGRY_HEALTH = 40
+
+# How sharply a lead in score turns into a reward close to 1
+REWARD_SCALE = 4.0
+
+# Owners of squares in the partition which aren't owned by a single snake
+UNREACHED = -1
+CONTESTED = -2
+
+
+# Runs a breadth first search from every head at once over the squares without a snake in them.
+# Returns the number of squares each slot (index into snakes) reaches first and the distance to the
+# closest food each slot reaches first or at the same time as another snake (None if there isn't
+# any). Squares reached by several snakes at the same distance are contested and not searched from.
+def voronoi(board: sim.BoardState, snakes):
+    neighbours = board.geometry.neighbours
+    occupancy = board.occupancy
+    food = board.food
+
+    owner = [UNREACHED] * board.geometry.size
+    territory = [0] * len(snakes)
+    foodDistances = [None] * len(snakes)
+
+    frontier = []
+    for i, k in enumerate(snakes):
+        head = board.snakes[k].head
+        owner[head] = i
+        frontier.append(head)
+
+    distance = 0
+    while frontier:
+        distance += 1
+        reached = {}
+        for c in frontier:
+            i = owner[c]
+            for m, n in neighbours[c]:
+                if owner[n] != UNREACHED or occupancy[n] > 0:
+                    continue
+
+                previous = reached.get(n)
+                if previous is None:
+                    reached[n] = i
+                elif previous != i:
+                    reached[n] = CONTESTED
+
+                if n in food and foodDistances[i] is None:
+                    foodDistances[i] = distance
+
+        frontier = []
+        for n, i in reached.items():
+            owner[n] = i
+            if i != CONTESTED:
+                territory[i] += 1
+                frontier.append(n)
+
+    return territory, foodDistances
+
+
+# Returns the score of each snake's position on an unfinished board (see the top of the file)
+def scores(board: sim.BoardState) -> Dict[object, float]:
+    snakes = list(board.snakes)
+    territory, foodDistances = voronoi(board, snakes)
+    lengths = [board.snakes[k].length() for k in snakes]
+
+    totalTerritory = sum(territory) or 1
+    totalLength = sum(lengths)
+
+    result = {}
+    for i, k in enumerate(snakes):
+        score = TERRITORY_WEIGHT * territory[i] / totalTerritory + LENGTH_WEIGHT * lengths[i] / totalLength
+        health = board.snakes[k].health
+        if health < HUNGRY_HEALTH and (foodDistances[i] is None or foodDistances[i] > health):
+            score -= STARVING_PENALTY
+        result[k] = score
+
+    return result
+
+
+# Returns rewards in [-1, 1] for every snake on board (as a playout would), based on how far each
+# snake's score is ahead of the best of the others
+def evaluate(board: sim.BoardState) -> Dict[object, float]:
+    s = scores(board)
+    if len(s) < 2:
+        return {k: 1.0 for k in s}
+
+    rewards = {}
+    for k, score in s.items():
+        best = max(other for j, other in s.items() if j != k)
+        rewards[k] = math.tanh(REWARD_SCALE * (score - best))
+
+    return rewards
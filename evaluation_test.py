@@ -0,0 +1,38 @@
+import copy
+import random as rd
+
+import geometry
+import simulator as sim
+import ai
+import evaluation
+
+def test_voronoi_splits_open_board_between_heads():
+  g = geometry.get_geometry(7, 1)
+  board = sim.BoardState(7, 1, {"a": sim.Snake(g.cell(0, 0), []), "b": sim.Snake(g.cell(6, 0), [])}, {g.cell(5, 0)}, 0)
+  territory, foodDistances = evaluation.voronoi(board, ["a", "b"])
+
+  # The middle square is reached by both at the same time
+  assert territory == [2, 2]
+  assert foodDistances == [None, 1]
+
+def test_walled_in_snake_is_losing():
+  g = geometry.get_geometry(7, 7)
+  trapped = sim.Snake(g.cell(0, 0), [g.cell(1, 0), g.cell(1, 1), g.cell(0, 1)])
+  free = sim.Snake(g.cell(4, 4), [g.cell(4, 3)])
+  board = sim.BoardState(7, 7, {"trapped": trapped, "free": free}, set(), 0)
+
+  rewards = evaluation.evaluate(board)
+  assert rewards["free"] > 0 > rewards["trapped"]
+  assert all(-1.0 <= r <= 1.0 for r in rewards.values())
+
+def test_evaluation_playout_scores_string_ids():
+  board = sim.generate_board(11, 11, 3, rng=rd.Random(16))
+  board.snakes = {str(k): snake for k, snake in board.snakes.items()}
+  before = copy.deepcopy(board)
+
+  rewards = ai.evaluation_playout(board)
+  assert set(rewards) == {"0", "1", "2"}
+  assert hash(board) == hash(before)
+
+  rewards = ai.mcts_playout(board)
+  assert set(rewards) == {"0", "1", "2"}
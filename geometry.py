@@ -0,0 +1,89 @@
+import functools
+from dataclasses import dataclass
+
+# Squares on the board are stored as integer cells (y * w + x) rather than Position objects so that
+# the simulator and the move filters never have to build a Position or bounds check one. Everything
+# that depends only on the size of the board (neighbours, coordinates) is worked out once per size
+# by get_geometry and shared by every board of that size.
+
+@dataclass(frozen=True)
+class Position:
+    x: int
+    y: int
+
+Direction = Position
+
+UP    = Direction( 0,  1)
+DOWN  = Direction( 0, -1)
+LEFT  = Direction(-1,  0)
+RIGHT = Direction( 1,  0)
+
+# List of available moves
+MOVES = [UP, DOWN, LEFT, RIGHT]
+
+# Cell reached by moving off the edge of the board
+OFF_BOARD = -1
+
+
+class Geometry:
+    def __init__(self, w: int, h: int):
+        self.w = w
+        self.h = h
+        self.size = w * h
+
+        self.xs = [c % w for c in range(self.size)]
+        self.ys = [c // w for c in range(self.size)]
+
+        # steps[move][cell] is the cell reached by moving from cell, or OFF_BOARD
+        self.steps = {
+            m: [self.cell(self.xs[c] + m.x, self.ys[c] + m.y) for c in range(self.size)]
+            for m in MOVES
+        }
+
+        # neighbours[cell] lists (move, cell reached) for the moves from cell which stay on the
+        # board, in the same order as MOVES. neighbourIndices is the same with the index of the
+        # move in MOVES instead of the move.
+        self.neighbours = [
+            tuple((m, self.steps[m][c]) for m in MOVES if self.steps[m][c] != OFF_BOARD)
+            for c in range(self.size)
+        ]
+        self.neighbourIndices = [
+            tuple((d, self.steps[m][c]) for d, m in enumerate(MOVES) if self.steps[m][c] != OFF_BOARD)
+            for c in range(self.size)
+        ]
+
+    # Boards are copied and sent to other processes a lot, so they all share one Geometry per size
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (get_geometry, (self.w, self.h))
+
+    # Returns the cell at (x, y), or OFF_BOARD if that is out of bounds
+    def cell(self, x: int, y: int):
+        if (0 <= x and x < self.w) and (0 <= y and y < self.h):
+            return y * self.w + x
+        else:
+            return OFF_BOARD
+
+    def position(self, cell: int):
+        return Position(self.xs[cell], self.ys[cell])
+
+    def distance(self, c1: int, c2: int):
+        return abs(self.xs[c1] - self.xs[c2]) + abs(self.ys[c1] - self.ys[c2])
+
+    # Returns the move which goes from c1 to c2, or None if they aren't next to each other
+    def move_between(self, c1: int, c2: int):
+        if c1 == OFF_BOARD:
+            return None
+
+        for m, c in self.neighbours[c1]:
+            if c == c2:
+                return m
+
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(w: int, h: int):
+    return Geometry(w, h)
@@ -0,0 +1,26 @@
+import copy
+import pickle
+
+import geometry
+
+def test_steps_match_coordinates():
+  for (w, h) in [(1, 1), (7, 11), (19, 19)]:
+    g = geometry.get_geometry(w, h)
+    for c in range(g.size):
+      p = g.position(c)
+      assert g.cell(p.x, p.y) == c
+      for m in geometry.MOVES:
+        x, y = p.x + m.x, p.y + m.y
+        expected = y * w + x if 0 <= x < w and 0 <= y < h else geometry.OFF_BOARD
+        assert g.steps[m][c] == expected
+        assert ((m, expected) in g.neighbours[c]) == (expected != geometry.OFF_BOARD)
+        assert ((geometry.MOVES.index(m), expected) in g.neighbourIndices[c]) == (expected != geometry.OFF_BOARD)
+        if expected != geometry.OFF_BOARD:
+          assert g.move_between(c, expected) == m
+          assert g.distance(c, expected) == 1
+
+def test_geometry_is_shared():
+  g = geometry.get_geometry(11, 11)
+  assert geometry.get_geometry(11, 11) is g
+  assert copy.deepcopy(g) is g
+  assert pickle.loads(pickle.dumps(g)) is g
@@ -0,0 +1,48 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+import process_local
+
+# Logging for the server. Modules log to children of the "battlesnake" logger. Records are put on a
+# queue and written out by a background thread so that a slow stderr never holds up a /move
+# request. Until setup_logging is called (e.g. in tests or scripts) only warnings and errors are
+# shown.
+
+LOG_LEVEL = os.environ.get("BATTLESNAKE_LOG_LEVEL", "INFO").upper()
+
+LOG_FORMAT = "%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s"
+
+logger = logging.getLogger("battlesnake")
+
+
+def get_logger(name: str):
+    return logger.getChild(name)
+
+
+# Starts the thread which writes out the records logged in this process
+def start_listener():
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    return listener
+
+
+listener = process_local.ProcessLocal(start_listener)
+
+
+def setup_logging(level=LOG_LEVEL):
+    listener.get()
+    logger.setLevel(level)
+    logger.propagate = False
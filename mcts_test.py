@@ -0,0 +1,160 @@
+import copy
+import itertools
+import random as rd
+
+import simulator as sim
+import ai
+
+def test_sampler_returns_every_joint_action_once():
+  rd.seed(11)
+  actions = {0: [sim.UP, sim.LEFT], 1: [sim.DOWN], 2: [sim.UP, sim.DOWN, sim.RIGHT]}
+  sampler = ai.JointActionSampler(actions)
+
+  sampled = []
+  while (a := sampler.sample()) is not None:
+    sampled.append(tuple(a.items()))
+
+  expected = [tuple(zip(actions, ms)) for ms in itertools.product(*actions.values())]
+  assert sorted(sampled, key=str) == sorted(expected, key=str)
+  assert sampler.sample() is None
+
+def test_duct_selects_once_root_is_fully_expanded():
+  rd.seed(12)
+  board = sim.generate_board(11, 11, 2)
+  board.foodSpawnChance = 0
+  nodes = ai.DuctTree()
+  root = ai.add_node_duct(nodes, board)
+
+  for i in range(200):
+    ai.mcts_duct_iter(nodes, board, ai.mcts_playout)
+
+  assert nodes.unexpanded[root].remaining == 0
+  assert len(nodes.get_children(root)) == 16
+  assert len(nodes) > len(nodes.get_children(root)) + 1
+  assert nodes.visits[root] == 200
+
+def test_prune_keeps_statistics_of_reachable_nodes():
+  rd.seed(13)
+  board = sim.generate_board(11, 11, 2)
+  nodes = ai.DuctTree()
+  ai.search_duct(board, 50, nodes=nodes)
+
+  (a, childKey) = max(nodes.get_children(nodes.ids[hash(board)]).items(), key=lambda c: nodes.visits[nodes.ids[c[1]]])
+  before = {key: (nodes.visits[i], {k: nodes.reward_info(i, k) for k in board.snakes}, nodes.get_children(i)) for key, i in nodes.ids.items()}
+
+  ai.prune_duct(nodes, childKey)
+
+  assert childKey in nodes
+  assert hash(board) not in nodes
+  for key, i in nodes.ids.items():
+    assert (nodes.visits[i], {k: nodes.reward_info(i, k) for k in board.snakes}, nodes.get_children(i)) == before[key]
+
+def test_duct_tree_stays_within_capacity():
+  rd.seed(14)
+  board = sim.generate_board(11, 11, 2)
+  nodes = ai.DuctTree(maxNodes=100)
+  rootInfo, iterations = ai.search_duct(board, 200, nodes=nodes)
+
+  assert len(nodes) <= 100
+  assert hash(board) in nodes
+  assert nodes.evictions > 0
+  assert nodes.hits > 0
+  assert nodes.misses == len(nodes) + nodes.evictions - 1
+  assert sum(info.visitCount for info in rootInfo[0].values()) == iterations
+
+def test_suct_tree_stays_within_capacity():
+  rd.seed(15)
+  board = sim.generate_board(11, 11, 2)
+  board.foodSpawnChance = 0
+  s = ai.StateSUCT(board, list(board.snakes))
+  nodes = ai.TreeSUCT(maxNodes=100)
+  ai.add_node_suct(nodes, s)
+
+  for i in range(1000):
+    ai.mcts_iter_suct(nodes, s, ai.mcts_playout)
+    if nodes.over_capacity():
+      nodes.evict(hash(s))
+
+  assert len(nodes) <= 100
+  assert nodes[hash(s)].visitCount == 1000
+  assert nodes.evictions > 0
+
+def test_suct_child_pointers_match_stepped_states():
+  rd.seed(16)
+  board = sim.generate_board(11, 11, 2)
+  board.foodSpawnChance = 0
+  s = ai.StateSUCT(board, list(board.snakes))
+  nodes = ai.TreeSUCT()
+  ai.add_node_suct(nodes, s)
+
+  for i in range(300):
+    ai.mcts_iter_suct(nodes, s, ai.mcts_playout)
+
+  root = nodes[hash(s)]
+  assert set(root.children) == set(root.actions)
+  for a, childKey in root.children.items():
+    delta = s.step(a)
+    assert hash(s) == childKey
+    s.undo(delta)
+
+def test_safe_move_masks_match_avoid_oob_and_snakes():
+  rd.seed(17)
+  for game in range(100):
+    board = sim.generate_board(rd.choice([5, 7, 11]), rd.choice([5, 7, 11]), rd.randrange(2, 5))
+    while board.winner() == -1:
+      masks = ai.get_safe_move_masks(board)
+      for k, snake in board.snakes.items():
+        assert ai.MASK_ACTIONS[masks[k]] == ai.avoid_oob_and_snakes(board, sim.MOVES, snake.head)
+
+      board.step({k: ai.simple_player(board, k) for k in board.snakes})
+
+def test_seeded_search_is_repeatable():
+  board = sim.generate_board(7, 7, 2, rng=rd.Random(14))
+  nodes = ai.DuctTree()
+  s = copy.deepcopy(board)
+  s.rng = rd.Random(2)
+  ai.add_node_duct(nodes, s)
+  for i in range(100):
+    ai.mcts_duct_iter(nodes, s, ai.mcts_playout)
+  visits = list(nodes.visits[:len(nodes)])
+
+  nodes = ai.DuctTree()
+  s = copy.deepcopy(board)
+  s.rng = rd.Random(2)
+  ai.add_node_duct(nodes, s)
+  for i in range(100):
+    ai.mcts_duct_iter(nodes, s, ai.mcts_playout)
+  assert list(nodes.visits[:len(nodes)]) == visits
+
+def test_longest_snake_uses_snake_keys():
+  board = sim.generate_board(7, 7, 3, rng=rd.Random(15))
+  board.snakes = {"b": board.snakes[0], "c": board.snakes[1]}
+  board.snakes["c"].tail.append(board.snakes["c"].tail[-1])
+  assert ai.longest_snake(board) == "c"
+
+def test_path_grows_past_its_capacity():
+  board = sim.generate_board(7, 7, 2, rng=rd.Random(17))
+  trees = []
+  for path in [ai.SearchPath(1), ai.SearchPath()]:
+    nodes = ai.DuctTree()
+    s = copy.deepcopy(board)
+    s.rng = rd.Random(3)
+    ai.add_node_duct(nodes, s)
+    for i in range(300):
+      ai.mcts_duct_iter(nodes, s, ai.mcts_playout, path)
+    assert hash(s) == hash(board)
+    trees.append((dict(nodes.ids), list(nodes.visits)))
+
+  assert trees[0] == trees[1]
+
+def test_suct_selection_counts_elimination_as_losing_every_visit():
+  board = sim.generate_board(7, 7, 2, rng=rd.Random(26))
+  s = ai.StateSUCT(board, list(board.snakes))
+  player = s.current_turn_player()
+  other = s.turnOrder[1]
+
+  nodes = ai.TreeSUCT()
+  node = ai.NodeSUCT(20, {}, actions=[sim.UP, sim.DOWN], children={sim.UP: 1, sim.DOWN: 2})
+  nodes[1] = ai.NodeSUCT(10, {other: 10.0})  # player eliminated in every visit
+  nodes[2] = ai.NodeSUCT(10, {player: -5.0, other: 5.0})
+  assert ai.select_action_suct(nodes, node, s) == sim.DOWN
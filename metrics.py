@@ -0,0 +1,167 @@
+import bisect
+import os
+import threading
+import time
+
+# Counters and histograms for the search and the server, published in the Prometheus text format by
+# the /metrics route. Instrumentation is only switched on with BATTLESNAKE_METRICS=1, and the switch
+# is checked when a search starts rather than on every iteration: with it off the searches run the
+# same code as they would without any metrics, and the per request timers are a shared no-op.
+
+ENABLED = os.environ.get("BATTLESNAKE_METRICS", "0") == "1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Labels added to every sample (e.g. the worker process in production mode)
+LABELS = {}
+
+# Upper bounds of the histogram buckets for times (s), counts and sizes (bytes)
+TIME_BUCKETS = [1e-5, 2.5e-5, 1e-4, 2.5e-4, 1e-3, 2.5e-3, 1e-2, 2.5e-2, 0.1, 0.25, 1.0]
+COUNT_BUCKETS = [10, 30, 100, 300, 1000, 3000, 10000, 30000, 100000, 300000]
+DEPTH_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+BYTES_BUCKETS = [1 << n for n in range(10, 32, 2)]
+
+registry = []
+lock = threading.Lock()
+
+
+def format_labels(names, values):
+    pairs = list(LABELS.items()) + list(zip(names, values))
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelNames=()):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.values = {}
+        registry.append(self)
+
+    def inc(self, amount=1, *labels):
+        with lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labelNames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets, labelNames=()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labelNames = labelNames
+        self.values = {}  # labels -> [count in each bucket (not cumulative), sum, count]
+        registry.append(self)
+
+    def observe(self, value: float, *labels):
+        with lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, n) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                bucketLabels = format_labels(self.labelNames + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucketLabels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelNames, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelNames, labels)} {n}")
+        return lines
+
+
+PHASE_SECONDS = Histogram("battlesnake_phase_seconds", "Time spent in each phase of handling a move or running a search", TIME_BUCKETS, ("phase",))
+SEARCHES = Counter("battlesnake_searches_total", "Searches run", ("search",))
+ITERATIONS = Counter("battlesnake_search_iterations_total", "Search iterations run", ("search",))
+MOVE_ITERATIONS = Histogram("battlesnake_search_iterations", "Iterations run by each search", COUNT_BUCKETS, ("search",))
+MOVE_NODES = Histogram("battlesnake_search_nodes", "Nodes in the tree at the end of each search", COUNT_BUCKETS, ("search",))
+MOVE_DEPTH = Histogram("battlesnake_search_depth", "Deepest ply reached by each search", DEPTH_BUCKETS, ("search",))
+MOVE_TREE_BYTES = Histogram("battlesnake_tree_bytes", "Estimated memory used by the tree at the end of each search", BYTES_BUCKETS, ("search",))
+
+
+class Timer:
+    def __init__(self, phase: str):
+        self.phase = phase
+
+    def __enter__(self):
+        self.tStart = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        PHASE_SECONDS.observe(time.perf_counter() - self.tStart, self.phase)
+        return False
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+# Returns a context manager which records the time spent inside it as phase
+def phase(name: str):
+    return Timer(name) if ENABLED else NULL_TIMER
+
+
+# Returns f wrapped so that each call is recorded as phase
+def timed(name: str, f):
+    def wrapper(*args, **kwargs):
+        tStart = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            PHASE_SECONDS.observe(time.perf_counter() - tStart, name)
+
+    return wrapper
+
+
+def record_search(search: str, iterations: int, nodes: int, depth: int, treeBytes: int):
+    SEARCHES.inc(1, search)
+    ITERATIONS.inc(iterations, search)
+    MOVE_ITERATIONS.observe(iterations, search)
+    MOVE_NODES.observe(nodes, search)
+    MOVE_DEPTH.observe(depth, search)
+    MOVE_TREE_BYTES.observe(treeBytes, search)
+
+
+def render():
+    with lock:
+        lines = [line for metric in registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+# Merges the output of render from several processes, keeping the samples of each metric together
+# under a single HELP and TYPE
+def merge(texts):
+    headers = {}
+    samples = {}
+    for text in texts:
+        name = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                name = line.split()[2]
+                family = headers.setdefault(name, [])
+                if len(family) < 2:  # HELP and TYPE from the first text only
+                    family.append(line)
+                samples.setdefault(name, [])
+            elif line:
+                samples[name].append(line)
+
+    return "".join("\n".join(headers[name] + samples[name]) + "\n" for name in headers)
@@ -0,0 +1,40 @@
+import random as rd
+
+import simulator as sim
+import ai
+import metrics
+
+def test_histogram_buckets_are_cumulative():
+  h = metrics.Histogram("test_seconds", "Test", [1, 10], ("phase",))
+  metrics.registry.remove(h)
+  for value in [0.5, 5, 5, 50]:
+    h.observe(value, "a")
+
+  lines = h.render()
+  assert 'test_seconds_bucket{phase="a",le="1"} 1' in lines
+  assert 'test_seconds_bucket{phase="a",le="10"} 3' in lines
+  assert 'test_seconds_bucket{phase="a",le="+Inf"} 4' in lines
+  assert 'test_seconds_count{phase="a"} 4' in lines
+
+def test_merge_keeps_families_together():
+  a = "# HELP x X\n# TYPE x counter\nx{worker=\"0\"} 1\n# HELP y Y\n# TYPE y counter\ny{worker=\"0\"} 2\n"
+  b = a.replace('"0"', '"1"')
+  lines = metrics.merge([a, b]).splitlines()
+  assert lines == ["# HELP x X", "# TYPE x counter", 'x{worker="0"} 1', 'x{worker="1"} 1',
+                   "# HELP y Y", "# TYPE y counter", 'y{worker="0"} 2', 'y{worker="1"} 2']
+
+def test_search_records_phases_when_enabled(monkeypatch):
+  monkeypatch.setattr(metrics, "ENABLED", True)
+  board = sim.generate_board(7, 7, 2, rng=rd.Random(18))
+  before = metrics.SEARCHES.values.get(("duct",), 0)
+
+  ai.search_duct(board, 30, seed=1)
+
+  assert metrics.SEARCHES.values[("duct",)] == before + 1
+  for phase in ["clone", "selection", "expansion", "playout", "backpropagation"]:
+    assert metrics.PHASE_SECONDS.values[(phase,)][2] > 0
+  assert "battlesnake_search_depth_bucket" in metrics.render()
+
+def test_timers_are_shared_no_ops_when_disabled(monkeypatch):
+  monkeypatch.setattr(metrics, "ENABLED", False)
+  assert metrics.phase("clone") is metrics.NULL_TIMER
@@ -0,0 +1,141 @@
+import functools
+import os
+import random as rd
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+import simulator as sim
+import ai
+
+# Parallel versions of the MCTS searches in ai which spread the work over a pool of worker
+# processes. The pool is kept alive between searches so that the cost of starting the workers is
+# only paid once rather than on every /move request.
+#
+# Root parallelism: each worker builds its own tree from the same position and the reward info at
+# the roots is summed before picking a move.
+# Leaf parallelism: a single tree is built in this process but every playout is run once on each
+# worker and the rewards are averaged.
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Time (ms) taken off each worker's search to leave time to send the board and results between
+# processes
+IPC_MARGIN = 10
+
+pool = None
+poolWorkers = 0
+
+
+def seed_worker():
+    # Workers are forked from this process and would otherwise all start with the same random state
+    rd.seed()
+
+
+def get_pool(workers=DEFAULT_WORKERS):
+    global pool, poolWorkers
+
+    if pool is None or poolWorkers != workers:
+        shutdown_pool()
+        pool = ProcessPoolExecutor(workers, initializer=seed_worker)
+        poolWorkers = workers
+
+    return pool
+
+
+# Creates the pool and waits for all of its workers to have started
+def start_pool(workers=DEFAULT_WORKERS):
+    p = get_pool(workers)
+    for f in [p.submit(os.getpid) for i in range(workers)]:
+        f.result()
+
+
+def shutdown_pool():
+    global pool, poolWorkers
+
+    if pool is not None:
+        pool.shutdown()
+        pool = None
+        poolWorkers = 0
+
+
+# Adds the visits and rewards in other to rewardInfo
+def merge_reward_info(rewardInfo: Dict[sim.Direction, ai.RewardInfo], other: Dict[sim.Direction, ai.RewardInfo]):
+    for m, info in other.items():
+        if m in rewardInfo:
+            rewardInfo[m].visitCount += info.visitCount
+            rewardInfo[m].totalReward += info.totalReward
+        else:
+            rewardInfo[m] = ai.RewardInfo(info.visitCount, info.totalReward)
+
+
+# Returns the seed for worker i's search, so that the workers don't all make the same random choices
+def worker_seed(seed, i: int):
+    return None if seed is None else f"{seed}:{i}"
+
+
+# ----- Root parallelism -----#
+
+# Runs ai.search_duct on every worker and returns the summed root reward info for each snake along
+# with the total number of iterations
+def search_duct_root_parallel(board: sim.BoardState, maxTime=150, workers=DEFAULT_WORKERS, playout=ai.mcts_playout, seed=None):
+    p = get_pool(workers)
+    futures = [p.submit(ai.search_duct, board, maxTime - IPC_MARGIN, playout, seed=worker_seed(seed, i)) for i in range(workers)]
+
+    rootInfo = {}
+    iterations = 0
+    for f in futures:
+        info, workerIterations = f.result()
+        for k in info:
+            merge_reward_info(rootInfo.setdefault(k, {}), info[k])
+        iterations += workerIterations
+
+    return rootInfo, iterations
+
+
+def search_suct_root_parallel(board: sim.BoardState, playerIndex, maxTime=150, workers=DEFAULT_WORKERS, playout=ai.mcts_playout, seed=None):
+    p = get_pool(workers)
+    futures = [p.submit(ai.search_suct, board, playerIndex, maxTime - IPC_MARGIN, playout, seed=worker_seed(seed, i)) for i in range(workers)]
+
+    rootInfo = {}
+    iterations = 0
+    for f in futures:
+        info, workerIterations = f.result()
+        merge_reward_info(rootInfo, info)
+        iterations += workerIterations
+
+    return rootInfo, iterations
+
+
+def mcts_duct_root_parallel(board: sim.BoardState, playerIndex, maxTime=150, workers=DEFAULT_WORKERS, playout=ai.mcts_playout, seed=None):
+    rootInfo, iterations = search_duct_root_parallel(board, maxTime, workers, playout, seed)
+    return ai.best_move(rootInfo[playerIndex])
+
+
+def mcts_suct_root_parallel(board: sim.BoardState, playerIndex, maxTime=150, workers=DEFAULT_WORKERS, playout=ai.mcts_playout, seed=None):
+    rootInfo, iterations = search_suct_root_parallel(board, playerIndex, maxTime, workers, playout, seed)
+    return ai.best_move(rootInfo)
+
+
+# ----- Leaf parallelism -----#
+
+# Runs ai.mcts_playout from s with its rng seeded with seed
+def seeded_playout(s: sim.BoardState, seed):
+    s.rng = rd.Random(seed)
+    return ai.mcts_playout(s)
+
+
+# Runs one ai.mcts_playout from s on each worker and returns the average rewards. Each worker's
+# playout gets its own seed drawn from s.rng, since s (and its rng) is copied to every worker.
+def mcts_playout_leaf_parallel(s: sim.BoardState, workers=DEFAULT_WORKERS):
+    seeds = [s.rng.getrandbits(64) for i in range(workers)]
+    results = list(get_pool(workers).map(seeded_playout, [s] * workers, seeds))
+    return {k: sum(rs[k] for rs in results) / len(results) for k in results[0]}
+
+
+def mcts_duct_leaf_parallel(board: sim.BoardState, playerIndex, maxTime=150, workers=DEFAULT_WORKERS):
+    return ai.mcts_duct(board, playerIndex, maxTime, functools.partial(mcts_playout_leaf_parallel, workers=workers))
+
+
+def mcts_suct_leaf_parallel(board: sim.BoardState, playerIndex, maxTime=150, workers=DEFAULT_WORKERS):
+    return ai.mcts_suct(board, playerIndex, maxTime, functools.partial(mcts_playout_leaf_parallel, workers=workers))
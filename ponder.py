@@ -0,0 +1,162 @@
+import contextlib
+import copy
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+import log
+import metrics
+import process_local
+import ai
+
+# Pondering: searching a game's tree between turns. Once a move has been sent back, the tree it was
+# picked from is searched further by a background thread, mostly below the moves we and the other
+# snakes are likely to make, so that when the next /move request arrives (and the tree is rerooted
+# at the new position) the search starts with more of the tree explored. Switched on with
+# BATTLESNAKE_PONDER=1.
+#
+# There is one pondering thread per process. It takes the games with a tree to ponder in turn,
+# searching each for PONDER_SLICE ms before moving on to the next, so every game gets the same
+# share. All pondering stops while any /move request is being handled: the live searches would
+# otherwise be competing with it for the interpreter. The pondering thread checks for requests after
+# every iteration, so a request only waits about one iteration before it has the tree to itself.
+
+logger = log.get_logger("ponder")
+
+ENABLED = os.environ.get("BATTLESNAKE_PONDER", "0") == "1"
+
+# Time (ms) spent on one game before moving on to the next
+PONDER_SLICE = float(os.environ.get("BATTLESNAKE_PONDER_SLICE_MS", "10"))
+
+# Games are pondered for at most this long (s) after a move, in case the next request never comes
+PONDER_LIMIT = float(os.environ.get("BATTLESNAKE_PONDER_LIMIT", "5"))
+
+
+class Task:
+    def __init__(self, nodes: ai.Tree, board, playout):
+        self.nodes = nodes
+        self.board = board  # the board the move was searched from, copied when pondering starts
+        self.s = None
+        self.playout = playout
+        self.path = ai.SearchPath()
+        self.expires = time.monotonic() + PONDER_LIMIT
+        self.iterations = 0
+
+
+class Ponderer:
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.tasks = OrderedDict()  # game id -> Task, in the order they will be pondered
+        self.liveSearches = 0
+        self.current = None  # id of the game being pondered
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Stops pondering until resume is called, waiting until the pondering thread has let go of the
+    # tree it was searching. gameId's task is dropped since its tree is about to be searched for real.
+    def pause(self, gameId: str):
+        with self.changed:
+            self.liveSearches += 1
+            self.tasks.pop(gameId, None)
+            while self.current is not None:
+                self.changed.wait()
+
+    def resume(self):
+        with self.changed:
+            self.liveSearches -= 1
+            self.changed.notify_all()
+
+    # Ponders the tree nodes, rooted at board, until the game's next request
+    def ponder(self, gameId: str, nodes: ai.Tree, board, playout):
+        with self.changed:
+            self.tasks[gameId] = Task(nodes, board, playout)
+            self.changed.notify_all()
+
+    def forget(self, gameId: str):
+        with self.changed:
+            self.tasks.pop(gameId, None)
+
+    # Returns the next game to ponder, waiting until there is one and no live searches
+    def next_task(self):
+        with self.changed:
+            while True:
+                now = time.monotonic()
+                for gameId in [gameId for gameId, task in self.tasks.items() if task.expires < now]:
+                    task = self.tasks.pop(gameId)
+                    logger.debug("%s pondered %d iterations", gameId, task.iterations)
+
+                if self.liveSearches == 0 and self.tasks:
+                    gameId, task = next(iter(self.tasks.items()))
+                    self.current = gameId
+                    return gameId, task
+
+                self.changed.wait(PONDER_LIMIT if self.tasks else None)
+
+    def run(self):
+        while True:
+            gameId, task = self.next_task()
+            try:
+                if task.s is None:
+                    task.s = copy.deepcopy(task.board)
+                    task.s.foodSpawnChance = 0
+                    task.board = None
+
+                sliceEnd = time.perf_counter() + PONDER_SLICE / 1000
+                iterations = ai.ponder_duct(
+                    task.nodes, task.s,
+                    lambda: self.liveSearches > 0 or time.perf_counter() > sliceEnd,
+                    task.playout, task.path,
+                )
+                task.iterations += iterations
+                if metrics.ENABLED:
+                    metrics.ITERATIONS.inc(iterations, "ponder")
+                failed = False
+            except Exception:
+                logger.exception("%s pondering failed", gameId)
+                failed = True
+
+            with self.changed:
+                self.current = None
+                # The task stays queued while it is pondered, so if it is still there the game's next
+                # request (or its end) hasn't arrived and it goes to the back of the queue
+                if self.tasks.get(gameId) is task:
+                    if failed:
+                        self.tasks.pop(gameId)
+                    else:
+                        self.tasks.move_to_end(gameId)
+                self.changed.notify_all()
+
+
+# Returns the ponderer for this process
+def get_ponderer():
+    return ponderer.get()
+
+
+ponderer = process_local.ProcessLocal(Ponderer)
+
+
+# Context manager for handling a /move request for gameId, which pauses pondering inside it
+@contextlib.contextmanager
+def paused(gameId: str):
+    if not ENABLED:
+        yield
+        return
+
+    p = get_ponderer()
+    p.pause(gameId)
+    try:
+        yield
+    finally:
+        p.resume()
+
+
+def ponder(gameId: str, nodes: ai.Tree, board, playout):
+    if ENABLED:
+        get_ponderer().ponder(gameId, nodes, board, playout)
+
+
+def forget(gameId: str):
+    if ENABLED:
+        get_ponderer().forget(gameId)
@@ -0,0 +1,50 @@
+import copy
+import random as rd
+import time
+
+import simulator as sim
+import ai
+import ponder
+
+def new_tree(seed):
+  board = sim.generate_board(7, 7, 2, rng=rd.Random(seed))
+  nodes = ai.DuctTree()
+  ai.search_duct(board, nodes=nodes, deadline=time.perf_counter() + 0.02, seed=seed)
+  return board, nodes
+
+def root_visits(nodes, board):
+  return nodes.visits[nodes.ids[hash(board)]]
+
+def test_ponder_duct_runs_until_stopped():
+  board, nodes = new_tree(25)
+  before = root_visits(nodes, board)
+  s = copy.deepcopy(board)
+  s.foodSpawnChance = 0
+
+  calls = []
+  iterations = ai.ponder_duct(nodes, s, lambda: calls.append(1) or len(calls) > 50)
+  assert iterations == 50
+  assert root_visits(nodes, board) == before + 50
+  assert hash(s) == hash(board)
+
+def test_games_share_pondering_and_pause_stops_it():
+  p = ponder.Ponderer()
+  games = {gameId: new_tree(seed) for seed, gameId in enumerate(["a", "b"])}
+  before = {gameId: root_visits(nodes, board) for gameId, (board, nodes) in games.items()}
+  for gameId, (board, nodes) in games.items():
+    p.ponder(gameId, nodes, board, ai.mcts_playout)
+
+  time.sleep(0.2)
+  p.pause("a")
+  try:
+    assert p.current is None
+    assert "a" not in p.tasks and "b" in p.tasks
+    visits = {gameId: root_visits(nodes, board) for gameId, (board, nodes) in games.items()}
+    assert all(visits[gameId] > before[gameId] for gameId in games)
+
+    # Nothing is pondered while a live search is running
+    time.sleep(0.05)
+    assert all(root_visits(nodes, board) == visits[gameId] for gameId, (board, nodes) in games.items())
+  finally:
+    p.resume()
+  p.forget("b")
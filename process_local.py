@@ -0,0 +1,27 @@
+import os
+import threading
+
+# The log listener, the recorder and the ponderer each run a background thread, and threads don't
+# survive a fork: a production worker forked from the router would inherit the object with its
+# thread gone. A ProcessLocal holds one such object per process. It is made by calling make the first
+# time get is called in a process, and forgotten in the child whenever the process forks, so each
+# worker makes its own.
+class ProcessLocal:
+    def __init__(self, make):
+        self.make = make
+        self.value = None
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self.value = None
+        # Another thread may have been holding the lock when the process forked
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.value is None:
+            with self.lock:
+                if self.value is None:
+                    self.value = self.make()
+
+        return self.value
@@ -0,0 +1,27 @@
+import os
+
+import process_local
+
+def test_value_is_made_once_per_process():
+  made = []
+  def make():
+    made.append(os.getpid())
+    return object()
+  local = process_local.ProcessLocal(make)
+
+  value = local.get()
+  assert local.get() is value
+
+  r, w = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    # Report from the child whether it made its own value
+    os.write(w, b"1" if local.get() is not value and made[-1] == os.getpid() else b"0")
+    os._exit(0)
+
+  os.close(w)
+  assert os.read(r, 1) == b"1"
+  os.close(r)
+  os.waitpid(pid, 0)
+  assert local.get() is value
+  assert made == [os.getpid()]
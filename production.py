@@ -0,0 +1,233 @@
+import http.client
+import http.server
+import json
+import multiprocessing
+import os
+import queue
+import re
+import socket
+import threading
+import time
+import zlib
+
+import log
+import metrics
+import parallel
+import server_logic
+
+# Production serving mode. The Flask development server handles one request at a time, so games
+# queue up behind each other's searches. Here the app is run by several worker processes instead,
+# each forked from a parent which has already imported everything and each warmed up with a short
+# search before it takes any requests.
+#
+# Per game state (the search tree, time measurements) lives in the worker that handles the game, so
+# every request for a game has to go to the same worker. The parent runs a small router on the
+# public port which picks the worker from a hash of the game id and forwards the request to it.
+
+logger = log.get_logger("production")
+
+WORKERS = int(os.environ.get("BATTLESNAKE_HTTP_WORKERS", str(os.cpu_count() or 1)))
+
+# Workers listen on localhost on consecutive ports starting from this one
+WORKER_BASE_PORT = int(os.environ.get("BATTLESNAKE_WORKER_BASE_PORT", "9100"))
+
+# How long (s) to wait for a worker to start listening
+WORKER_START_TIMEOUT = 30
+
+# Header the router adds to each request it forwards, holding the time.perf_counter() value when the
+# request reached the router. The time manager counts the move timeout from then, so the hop from
+# the router to the worker is included. The router and workers run on the same machine, so their
+# perf_counter clocks agree.
+REQUEST_START_HEADER = "X-Battlesnake-Request-Start"
+
+# Set in worker processes, which only take requests from the router
+behindRouter = False
+
+# The engine sends the game object (starting with its id) first, so the id can usually be found
+# without parsing the whole request
+GAME_ID_PATTERN = re.compile(rb'"game"\s*:\s*\{\s*"id"\s*:\s*"([^"]*)"')
+
+
+def worker_for_game(gameId: str, workers: int):
+    return zlib.crc32(gameId.encode()) % workers
+
+
+def find_game_id(body: bytes):
+    match = GAME_ID_PATTERN.search(body)
+    if match is not None:
+        return match.group(1).decode()
+
+    try:
+        return json.loads(body)["game"]["id"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def run_worker(app, port: int):
+    global behindRouter
+    from werkzeug.serving import make_server
+
+    behindRouter = True
+    log.setup_logging()
+    metrics.LABELS["worker"] = str(port - WORKER_BASE_PORT)
+
+    # Each worker needs its own search pool since a pool can't be shared across a fork
+    if server_logic.SEARCH_WORKERS > 1:
+        parallel.start_pool(server_logic.SEARCH_WORKERS)
+
+    server_logic.warm_up()
+    app.test_client().get("/")
+
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    server.serve_forever()
+
+
+def start_worker(app, port: int):
+    process = multiprocessing.get_context("fork").Process(target=run_worker, args=(app, port), daemon=True)
+    process.start()
+    return process
+
+
+def wait_for_port(port: int, timeout=WORKER_START_TIMEOUT):
+    tEnd = time.monotonic() + timeout
+    while time.monotonic() < tEnd:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+
+    return False
+
+
+# Connection to a worker with Nagle's algorithm switched off, so that small requests aren't held back
+# waiting for the acknowledgement of the previous packet
+class WorkerConnection(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class Router(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, workerPorts):
+        super().__init__(address, RouterHandler)
+        self.workerPorts = workerPorts
+        self.connections = [queue.SimpleQueue() for port in workerPorts]
+
+    # Sends a request to a worker over a kept alive connection and returns the response
+    def forward(self, worker: int, method: str, path: str, body, headers):
+        for attempt in range(2):
+            try:
+                conn = self.connections[worker].get_nowait()
+            except queue.Empty:
+                conn = WorkerConnection("127.0.0.1", self.workerPorts[worker])
+
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                # The connection may have been closed by the worker, so retry once on a new one
+                conn.close()
+                if attempt == 1:
+                    raise
+                continue
+
+            self.connections[worker].put(conn)
+            return response.status, response.getheader("Content-Type", "text/plain"), data
+
+
+class RouterHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.collect_metrics()
+        else:
+            self.forward(0, None)
+
+    # Every worker has its own metrics, so they are fetched from all of them and merged
+    def collect_metrics(self):
+        texts = []
+        for worker in range(len(self.server.workerPorts)):
+            try:
+                status, contentType, data = self.server.forward(worker, "GET", "/metrics", None, {})
+                texts.append(data.decode())
+            except (OSError, http.client.HTTPException):
+                pass  # a worker which is restarting just misses out
+
+        self.respond(200, metrics.CONTENT_TYPE, metrics.merge(texts).encode())
+
+    def do_POST(self):
+        self.requestStart = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        gameId = find_game_id(body)
+        worker = worker_for_game(gameId, len(self.server.workerPorts)) if gameId is not None else 0
+        self.forward(worker, body)
+
+    def forward(self, worker: int, body):
+        headers = {"Content-Type": self.headers.get("Content-Type", "application/json")}
+        if self.command == "POST":
+            headers[REQUEST_START_HEADER] = repr(self.requestStart)
+        try:
+            status, contentType, data = self.server.forward(worker, self.command, self.path, body, headers)
+        except (OSError, http.client.HTTPException):
+            status, contentType, data = 502, "text/plain", b"worker unavailable"
+
+        self.respond(status, contentType, data)
+
+    # Sends the headers and the body in a single write. Sent separately, the body of a kept alive
+    # connection can wait on the client's delayed acknowledgement of the headers (~40 ms).
+    def respond(self, status: int, contentType: str, data: bytes):
+        reason = self.responses.get(status, ("",))[0]
+        head = (
+            f"{self.protocol_version} {status} {reason}\r\n"
+            f"Content-Type: {contentType}\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n"
+        )
+        self.wfile.write(head.encode("latin-1") + data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Returns when a request forwarded by the router reached it, or now for any other request
+def request_start(headers):
+    now = time.perf_counter()
+    forwarded = headers.get(REQUEST_START_HEADER) if behindRouter else None
+    if forwarded is None:
+        return now
+
+    try:
+        return min(float(forwarded), now)
+    except ValueError:
+        return now
+
+
+# Runs app on port with the given number of worker processes. Blocks forever, restarting any
+# worker which dies.
+def serve(app, port: int, workers=WORKERS):
+    workerPorts = [WORKER_BASE_PORT + i for i in range(workers)]
+    processes = [start_worker(app, p) for p in workerPorts]
+    for p in workerPorts:
+        if not wait_for_port(p):
+            raise RuntimeError(f"Worker on port {p} failed to start")
+
+    router = Router(("0.0.0.0", port), workerPorts)
+    threading.Thread(target=router.serve_forever, daemon=True).start()
+    logger.info("Serving on port %d with %d workers", port, workers)
+
+    try:
+        while True:
+            time.sleep(1)
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning("Worker %d exited with code %s, restarting", i, process.exitcode)
+                    processes[i] = start_worker(app, workerPorts[i])
+    finally:
+        router.shutdown()
+        for process in processes:
+            process.terminate()
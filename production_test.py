@@ -0,0 +1,74 @@
+import http.client
+import http.server
+import json
+import threading
+import time
+
+import production
+
+def test_find_game_id_from_pattern_and_json():
+  assert production.find_game_id(b'{"game": {"id": "abc", "timeout": 500}, "turn": 3}') == "abc"
+  # Not in the order the pattern expects, so the body is parsed
+  assert production.find_game_id(json.dumps({"turn": 3, "game": {"timeout": 500, "id": "def"}}).encode()) == "def"
+  assert production.find_game_id(b'{"turn": 3}') is None
+  assert production.find_game_id(b'not json') is None
+
+def test_worker_for_game_is_stable_and_in_range():
+  workers = [production.worker_for_game(f"game-{i}", 4) for i in range(100)]
+  assert all(0 <= w < 4 for w in workers)
+  assert len(set(workers)) == 4
+  assert workers == [production.worker_for_game(f"game-{i}", 4) for i in range(100)]
+
+def test_request_start_uses_router_time_only_behind_router(monkeypatch):
+  routerStart = time.perf_counter() - 0.05
+  headers = {production.REQUEST_START_HEADER: repr(routerStart)}
+
+  monkeypatch.setattr(production, "behindRouter", False)
+  assert production.request_start(headers) > routerStart + 0.05
+
+  monkeypatch.setattr(production, "behindRouter", True)
+  assert production.request_start(headers) == routerStart
+  assert production.request_start({}) > routerStart + 0.05
+  assert production.request_start({production.REQUEST_START_HEADER: "later"}) > routerStart + 0.05
+
+  # A start in the future can't push the deadline back
+  future = {production.REQUEST_START_HEADER: repr(time.perf_counter() + 10)}
+  assert production.request_start(future) <= time.perf_counter()
+
+# Stands in for a worker, answering with the request start the router sent
+class EchoStartHandler(http.server.BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True
+
+  def do_POST(self):
+    self.rfile.read(int(self.headers["Content-Length"]))
+    data = self.headers.get(production.REQUEST_START_HEADER, "").encode()
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def log_message(self, format, *args):
+    pass
+
+def test_router_forwards_request_start_without_stalling():
+  worker = http.server.ThreadingHTTPServer(("127.0.0.1", 0), EchoStartHandler)
+  router = production.Router(("127.0.0.1", 0), [worker.server_address[1]])
+  for server in [worker, router]:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+  try:
+    conn = http.client.HTTPConnection("127.0.0.1", router.server_address[1])
+    latencies = []
+    for i in range(10):
+      tStart = time.perf_counter()
+      conn.request("POST", "/move", b'{"game": {"id": "g"}}', {"Content-Type": "application/json"})
+      start = float(conn.getresponse().read())
+      latencies.append(time.perf_counter() - tStart)
+      assert tStart <= start <= time.perf_counter()
+
+    # Kept alive requests used to wait ~40 ms on a delayed acknowledgement
+    assert sorted(latencies)[len(latencies) // 2] < 0.02
+  finally:
+    router.shutdown()
+    worker.shutdown()
@@ -0,0 +1,83 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+import process_local
+
+# Records the /start, /move and /end requests the server receives to a JSONL file so that games can
+# be replayed later with benchmarks/replay.py. Switched on by setting BATTLESNAKE_RECORD to the path
+# of the log. Each line holds the time the request arrived, its path and body, and for /move
+# requests the move that was sent back and how long it took. Requests are put on a queue and
+# serialised and written out by a background thread, so recording never holds up a /move request.
+
+RECORD_PATH = os.environ.get("BATTLESNAKE_RECORD")
+ENABLED = RECORD_PATH is not None
+
+# How often (s) the writer thread writes out what has been queued
+FLUSH_INTERVAL = 1.0
+
+
+class Recorder:
+    def __init__(self, path: str):
+        self.entries = queue.SimpleQueue()
+        self.stopped = threading.Event()
+
+        # Production workers all append to the same file, so each batch is written with one write
+        # call on a file opened for appending
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, entry: dict):
+        self.entries.put(entry)
+
+    def write_queued(self):
+        lines = []
+        while True:
+            try:
+                lines.append(json.dumps(self.entries.get_nowait()) + "\n")
+            except queue.Empty:
+                break
+
+        if lines:
+            os.write(self.fd, "".join(lines).encode())
+
+    def run(self):
+        while not self.stopped.wait(FLUSH_INTERVAL):
+            self.write_queued()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write_queued()
+        os.close(self.fd)
+
+
+def start_recorder():
+    r = Recorder(RECORD_PATH)
+    atexit.register(r.stop)
+    return r
+
+
+recorder = process_local.ProcessLocal(start_recorder)
+
+
+# Returns the recorder for this process
+def get_recorder():
+    return recorder.get()
+
+
+def record(path: str, data: dict, requestStart: float, **extra):
+    entry = {"time": time.time() - (time.perf_counter() - requestStart), "path": path, "data": data}
+    entry.update(extra)
+    get_recorder().record(entry)
+
+
+# Returns the entries of a log written by a Recorder
+def read_log(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,39 @@
+import random as rd
+
+import simulator as sim
+import ai
+import recorder
+import server_logic
+from benchmarks import replay
+
+def test_recorder_writes_entries_in_order(tmp_path):
+  path = tmp_path / "games.jsonl"
+  r = recorder.Recorder(str(path))
+  for turn in range(5):
+    r.record({"path": "/move", "data": {"turn": turn}, "move": "up"})
+  r.stop()
+
+  entries = recorder.read_log(str(path))
+  assert [e["data"]["turn"] for e in entries] == list(range(5))
+  assert all(e["move"] == "up" for e in entries)
+
+def test_replay_reports_every_move():
+  board = sim.generate_board(7, 7, 2, rng=rd.Random(24))
+  you = next(iter(board.snakes))
+  gameId = "replay-test"
+  entries = [{"time": 0.0, "path": "/start", "data": server_logic.convert_to_request(board, gameId, you, 100)}]
+  for i in range(3):
+    data = server_logic.convert_to_request(board, gameId, you, 100)
+    entries.append({"time": 0.0, "path": "/move", "data": data, "move": "up"})
+    board.step({k: ai.safe_player(board, k) for k in board.snakes})
+    if board.winner() != -1:
+      break
+  entries.append({"time": 0.0, "path": "/end", "data": entries[-1]["data"]})
+
+  results = replay.replay(entries, replay.LocalTarget)
+  assert len(results) == len(entries) - 2
+  assert all(r.iterations > 0 and r.nodesAdded > 0 for r in results)
+  assert all(r.changed == (r.move != "up") for r in results)
+
+  summary = replay.summarise(results)
+  assert summary["moves"] == len(results)
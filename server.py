@@ -1,14 +1,36 @@
+import json
 import logging
 import os
+import sys
+import time
 
 from flask import Flask
+from flask import g
 from flask import request
 
+import log
+import metrics
+import parallel
+import production
+import recorder
 import server_logic
 
+# orjson parses the request bodies several times faster than json but is optional
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
 
 app = Flask(__name__)
 
+logger = log.get_logger("server")
+
+
+def request_data():
+    return loads(request.get_data())
+
 
 @app.get("/")
 def handle_info():
@@ -21,7 +43,7 @@ def handle_info():
 
     TIP: If you open your Battlesnake URL in browser you should see this data.
     """
-    print("INFO")
+    logger.info("INFO")
     return {
         "apiversion": "1",
         "author": "db3005",
@@ -37,9 +59,13 @@ def handle_start():
     This function is called everytime your snake is entered into a game.
     request.json contains information about the game that's about to be played.
     """
-    data = request.get_json()
+    requestStart = time.perf_counter()
+    data = request_data()
+    server_logic.start_game(data)
+    if recorder.ENABLED:
+        recorder.record("/start", data, requestStart)
 
-    print(f"{data['game']['id']} START")
+    logger.info("%s START", data['game']['id'])
     return "ok"
 
 
@@ -49,28 +75,62 @@ def handle_move():
     This function is called on every turn of a game. It's how your snake decides where to move.
     Valid moves are "up", "down", "left", or "right".
     """
-    data = request.get_json()
+    requestStart = production.request_start(request.headers)
+    with metrics.phase("parse"):
+        data = request_data()
 
-    move = server_logic.choose_move(data)
+    move = server_logic.choose_move(data, requestStart)
 
+    g.gameId = data["game"]["id"]
+    g.moveChosen = time.perf_counter()
+    if recorder.ENABLED:
+        recorder.record("/move", data, requestStart, move=move, latencyMs=(g.moveChosen - requestStart) * 1000)
     return {"move": move}
 
 
+@app.after_request
+def record_response_time(response):
+    # The response has been serialised by now, so this lets the time manager measure how long
+    # everything after the search takes
+    if "gameId" in g:
+        server_logic.finish_move(g.gameId)
+        if metrics.ENABLED:
+            metrics.PHASE_SECONDS.observe(time.perf_counter() - g.moveChosen, "serialise")
+    return response
+
+
+@app.get("/metrics")
+def handle_metrics():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
 @app.post("/end")
 def end():
     """
     This function is called when a game your snake was in ends.
     It's purely for informational purposes, you don't have to make any decisions here.
     """
-    data = request.get_json()
+    requestStart = time.perf_counter()
+    data = request_data()
+    server_logic.end_game(data)
+    if recorder.ENABLED:
+        recorder.record("/end", data, requestStart)
 
-    print(f"{data['game']['id']} END")
+    logger.info("%s END", data['game']['id'])
     return "ok"
 
 
 if __name__ == "__main__":
     logging.getLogger("werkzeug").setLevel(logging.ERROR)
 
-    print("Starting Battlesnake Server...")
+    log.setup_logging()
+    logger.info("Starting Battlesnake Server...")
     port = int(os.environ.get("PORT", "8080"))
-    app.run(host="0.0.0.0", port=port, debug=True)
+
+    if "--production" in sys.argv:
+        production.serve(app, port)
+    else:
+        if server_logic.SEARCH_WORKERS > 1:
+            parallel.start_pool(server_logic.SEARCH_WORKERS)
+
+        app.run(host="0.0.0.0", port=port, debug=True)
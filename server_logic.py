@@ -1,7 +1,14 @@
+import logging
+import os
 import time
 
+import log
+import metrics
 import simulator as sim
 import ai
+import parallel
+import ponder
+import sessions
 
 """
 This file can be a nice home for your move logic, and to write helper functions.
@@ -10,8 +17,21 @@ We have started this for you, with a function to help remove the 'neck' directio
 from the list of possible moves!
 """
 
-def convert_to_position(p, h):
-  return sim.Position(p["x"], h - 1 - p["y"]) # y is flipped to make +y down
+logger = log.get_logger("server_logic")
+
+# Number of worker processes to spread each search over. With 1 the search runs in this process.
+SEARCH_WORKERS = int(os.environ.get("BATTLESNAKE_SEARCH_WORKERS", "1"))
+
+# How the leaves of the search are scored: full random playouts, or a few turns of playout followed
+# by the static evaluation in evaluation.py, or batches of random playouts on the batched simulator
+# (when numpy is installed)
+PLAYOUTS = {"rollout": ai.mcts_playout, "evaluation": ai.evaluation_playout}
+if ai.batch_simulator is not None:
+    PLAYOUTS["batched"] = ai.mcts_playout_batched
+PLAYOUT = PLAYOUTS[os.environ.get("BATTLESNAKE_PLAYOUT", "rollout")]
+
+def convert_to_cell(p, w, h):
+  return (h - 1 - p["y"]) * w + p["x"] # y is flipped to make +y down
 
 def convert_board(data: dict) -> (sim.BoardState, int):
   w = data["board"]["width"]
@@ -21,15 +41,130 @@ def convert_board(data: dict) -> (sim.BoardState, int):
   for i in range(len(data["board"]["snakes"])):
     snake = data["board"]["snakes"][i]
 
-    head = convert_to_position(snake["head"], h)
-    tail = [convert_to_position(p, h) for p in snake["body"]][1:] # body includes head so ignore first element
+    head = convert_to_cell(snake["head"], w, h)
+    tail = [convert_to_cell(p, w, h) for p in snake["body"]][1:] # body includes head so ignore first element
     health = snake["health"]
     snakes[snake["id"]] = sim.Snake(head, tail, health)
 
-  food = set([convert_to_position(f, h) for f in data["board"]["food"]])
+  food = set([convert_to_cell(f, w, h) for f in data["board"]["food"]])
     
   return sim.BoardState(w, h, snakes, food, data["turn"])
 
+# Converts the requests for one game, updating the board from the previous turn with what changed
+# rather than building a new one. Only the head, neck and tip of each snake are converted. If
+# anything doesn't line up with the previous board (a missed turn, a snake that moved further than
+# one square, ...) the board is converted from scratch instead.
+class IncrementalConverter:
+  def __init__(self):
+    self.board = None
+
+  # Returns the board for data and the moves each snake made since the previous call (see
+  # ai.infer_moves). The returned board is updated in place on the next call.
+  def convert(self, data: dict):
+    if self.board is not None:
+      moves = self.apply_changes(data)
+      if moves is not None:
+        return self.board, moves
+
+    # Moves can only be inferred from the turn before. After a gap a head can still happen to be next
+    # to where it was, and the moves would look valid without being the ones that were made.
+    prev = self.board
+    self.board = convert_board(data)
+    if prev is None or self.board.turn != prev.turn + 1:
+      return self.board, {}
+    return self.board, ai.infer_moves(prev, self.board)
+
+  # Updates self.board to match data and returns the moves made, or None (leaving self.board
+  # unchanged) if data isn't the turn after self.board
+  def apply_changes(self, data: dict):
+    board = self.board
+    w = board.w
+    h = board.h
+    if (data["board"]["width"] != w or data["board"]["height"] != h or
+        data["turn"] != board.turn + 1):
+      return None
+
+    # Check every snake before changing anything so the old board is intact if we have to rebuild
+    moves = {}
+    stackedTails = set()
+    for jsonSnake in data["board"]["snakes"]:
+      snake = board.snakes.get(jsonSnake["id"])
+      if snake is None:
+        return None
+
+      body = jsonSnake["body"]
+      if len(body) < 2:
+        return None
+
+      head = convert_to_cell(jsonSnake["head"], w, h)
+      move = board.geometry.move_between(snake.head, head)
+      grew = len(body) - snake.length()
+      if move is None or grew not in (0, 1) or convert_to_cell(body[1], w, h) != snake.head:
+        return None
+
+      # The new tail tip is the segment before the old one, unless the snake grew. The engine grows a
+      # snake by stacking a copy of that new tip, while the simulator keeps the old tip instead.
+      stacked = grew and body[-1] == body[-2]
+      if grew and not stacked:
+        tailTip = snake.tail[-1] if snake.tail else snake.head
+      else:
+        tailTip = snake.tail[-2] if len(snake.tail) >= 2 else snake.head
+      if tailTip != convert_to_cell(body[-1], w, h):
+        return None
+
+      moves[jsonSnake["id"]] = move
+      if stacked:
+        stackedTails.add(jsonSnake["id"])
+
+    for k in [k for k in board.snakes if k not in moves]:
+      board.remove_snake(k)
+
+    for jsonSnake in data["board"]["snakes"]:
+      snake = board.snakes[jsonSnake["id"]]
+      grew = len(jsonSnake["body"]) > snake.length()
+      snake.move(board.geometry.steps[moves[jsonSnake["id"]]][snake.head])
+      board.update_occupancy(snake.head, 1)
+      if not grew:
+        board.update_occupancy(snake.pop_tail(), -1)
+      elif jsonSnake["id"] in stackedTails:
+        board.update_occupancy(snake.pop_tail(), -1)
+        snake.push_tail(snake.tail[-1] if snake.tail else snake.head)
+        board.update_occupancy(snake.tail[-1], 1)
+      snake.set_health(jsonSnake["health"])
+
+    food = {convert_to_cell(f, w, h) for f in data["board"]["food"]}
+    for f in board.food - food:
+      board.remove_food(f)
+    for f in food - board.food:
+      board.add_food(f)
+
+    board.turn = data["turn"]
+    return moves
+
+def convert_from_cell(c: sim.Cell, board: sim.BoardState):
+  p = board.geometry.position(c)
+  return {"x": p.x, "y": board.h - 1 - p.y}
+
+# Inverse of convert_board. Builds a /move request for the snake you on board, used to drive the
+# server from simulated games.
+def convert_to_request(board: sim.BoardState, gameId: str, you, timeout=500) -> dict:
+  snakes = []
+  for k, snake in board.snakes.items():
+    body = [convert_from_cell(p, board) for p in [snake.head] + list(snake.tail)]
+    snakes.append({"id": k, "health": snake.health, "head": body[0], "body": body, "length": len(body)})
+
+  return {
+    "game": {"id": gameId, "timeout": timeout},
+    "turn": board.turn,
+    "board": {
+      "width": board.w,
+      "height": board.h,
+      "food": [convert_from_cell(f, board) for f in board.food],
+      "snakes": snakes,
+    },
+    "you": next(s for s in snakes if s["id"] == you),
+  }
+
 def convert_direction(dir: sim.Direction):
   if dir == sim.UP:
     return "down" # need to flip these to correspond to battlesnake's coordinates
@@ -43,11 +178,35 @@ def convert_direction(dir: sim.Direction):
     return None
 
 
-def choose_move(data: dict) -> str:
+def start_game(data: dict):
+    sessions.start_session(data["game"]["id"])
+
+
+def end_game(data: dict):
+    ponder.forget(data["game"]["id"])
+    sessions.end_session(data["game"]["id"])
+
+
+# Runs a short search so that the first real /move request doesn't pay for anything done lazily
+# (imports, Zobrist keys, caches)
+def warm_up(searchTime=50):
+    board = sim.generate_board(11, 11, 2)
+    ai.mcts_duct(board, next(iter(board.snakes)), searchTime)
+
+
+# Called once the response to a /move request is ready to be sent
+def finish_move(gameId: str):
+    sessions.get_session(gameId).timing.response_ready()
+
+
+def choose_move(data: dict, requestStart: float = None) -> str:
     """
     data: Dictionary of all Game Board data as received from the Battlesnake Engine.
     For a full example of 'data', see https://docs.battlesnake.com/references/api/sample-move-request
 
+    requestStart: time.perf_counter() value when the request arrived. The search is timed to finish
+    before the game's timeout counted from this point (defaults to now).
+
     return: A String, the single move to make. One of "up", "down", "left" or "right".
 
     Use the information in 'data' to decide your next move. The 'data' variable can be interacted
@@ -63,15 +222,45 @@ def choose_move(data: dict) -> str:
 
     #print(data)
 
+    if requestStart is None:
+        requestStart = time.perf_counter()
+
     snakeID = data["you"]["id"]
-    board = convert_board(data)
+    session = sessions.get_session(data["game"]["id"])
+
+    if session.converter is None:
+        session.converter = IncrementalConverter()
+
+    # The tree (and the board, which the converter updates in place) may be in use by pondering
+    # from the last turn until this is paused
+    with ponder.paused(data["game"]["id"]):
+        prevKey = hash(session.board) if session.board is not None else None
+        with metrics.phase("convert_board"):
+            board, moves = session.converter.convert(data)
+
+        deadline = session.timing.search_deadline(data, requestStart)
 
-    t1 = time.time_ns()
-    move = convert_direction(ai.mcts_duct(board, snakeID, 200))
-    t2 = time.time_ns()
-    print(t2 - t1, "ns")
+        t1 = time.time_ns()
+        if SEARCH_WORKERS > 1:
+            maxTime = (deadline - time.perf_counter()) * 1000
+            rootInfo, session.iterations = parallel.search_duct_root_parallel(board, maxTime, SEARCH_WORKERS, PLAYOUT)
+            session.nodesAdded = None
+        else:
+            # Carry on from the tree searched last turn (and pondered since)
+            ai.reroot_duct(session.nodes, prevKey, moves, board)
+            misses = session.nodes.misses
+            rootInfo, session.iterations = ai.search_duct(board, playout=PLAYOUT, nodes=session.nodes, deadline=deadline, playerIndex=snakeID)
+            session.nodesAdded = session.nodes.misses - misses
+            ponder.ponder(data["game"]["id"], session.nodes, board, PLAYOUT)
+        move = convert_direction(ai.best_move(rootInfo[snakeID]))
+        session.board = board
+        session.timing.search_finished()
+        t2 = time.time_ns()
+    logger.debug("Search took %.1f ms", (t2 - t1) / 1000000)
 
-    print(board)
-    print(f"{data['game']['id']} MOVE {data['turn']}: {move} picked")
+    # Rendering the board is only worth doing if it is going to be logged
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Board:\n%s", board)
+    logger.info("%s MOVE %d: %s picked", data['game']['id'], data['turn'], move)
 
     return move
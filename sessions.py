@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import simulator as sim
+import ai
+import time_manager
+
+# State kept for each game between requests so that the search tree from the previous turn can be
+# reused. Sessions are created when a game starts and removed when it ends, or once no request has
+# been seen for IDLE_TIMEOUT seconds (in case the /end request never arrives).
+
+IDLE_TIMEOUT = float(os.environ.get("BATTLESNAKE_SESSION_TIMEOUT", "300"))
+
+
+@dataclass
+class GameSession:
+    nodes: ai.Tree = field(default_factory=ai.DuctTree)
+    board: Optional[sim.BoardState] = None  # board searched on the previous turn
+    converter: object = None  # server_logic.IncrementalConverter for the game's requests
+    timing: time_manager.TimeManager = field(default_factory=time_manager.TimeManager)
+    lastSeen: float = field(default_factory=time.monotonic)
+    iterations: Optional[int] = None  # iterations run by the last search
+    nodesAdded: Optional[int] = None  # nodes added by the last search (None if it ran on several workers)
+
+
+sessions: Dict[str, GameSession] = {}
+lock = threading.Lock()
+
+
+def evict_idle_sessions(now: float):
+    for gameId in [gameId for gameId, session in sessions.items() if now - session.lastSeen > IDLE_TIMEOUT]:
+        sessions.pop(gameId)
+
+
+def start_session(gameId: str):
+    with lock:
+        now = time.monotonic()
+        evict_idle_sessions(now)
+        sessions[gameId] = GameSession(lastSeen=now)
+        return sessions[gameId]
+
+
+# Returns the session for a game, creating one if the game is unknown (e.g. the server was restarted
+# part way through the game)
+def get_session(gameId: str):
+    with lock:
+        now = time.monotonic()
+        evict_idle_sessions(now)
+
+        session = sessions.get(gameId)
+        if session is None:
+            session = sessions[gameId] = GameSession()
+
+        session.lastSeen = now
+        return session
+
+
+def end_session(gameId: str):
+    with lock:
+        sessions.pop(gameId, None)
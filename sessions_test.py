@@ -0,0 +1,183 @@
+import copy
+import random as rd
+
+import geometry
+import simulator as sim
+import ai
+import server_logic
+import sessions
+
+def searched_board():
+  rd.seed(7)
+  board = sim.generate_board(11, 11, 2)
+  board.foodSpawnChance = 0
+  nodes = ai.DuctTree()
+  ai.search_duct(board, 50, nodes=nodes)
+  return board, nodes
+
+def first_child(nodes: ai.DuctTree, board: sim.BoardState):
+  return next(iter(nodes.get_children(nodes.ids[hash(board)]).items()))
+
+def test_reroot_keeps_observed_child():
+  board, nodes = searched_board()
+  (a, childKey) = first_child(nodes, board)
+
+  nextBoard = copy.deepcopy(board)
+  nextBoard.step(dict(a))
+  ai.reroot_duct(nodes, hash(board), dict(a), nextBoard)
+
+  assert hash(nextBoard) == childKey
+  assert childKey in nodes
+  assert hash(board) not in nodes
+
+def test_reroot_after_food_spawn_keeps_child_statistics():
+  board, nodes = searched_board()
+  (a, childKey) = first_child(nodes, board)
+  childId = nodes.ids[childKey]
+  childVisits = nodes.visits[childId]
+  childInfo = {k: nodes.reward_info(childId, k) for k in board.snakes}
+
+  nextBoard = copy.deepcopy(board)
+  nextBoard.step(dict(a))
+  nextBoard.add_food(nextBoard.geometry.cell(5, 5))
+  ai.reroot_duct(nodes, hash(board), dict(a), nextBoard)
+
+  assert list(nodes) == [hash(nextBoard)]
+  assert nodes.visits[nodes.ids[hash(nextBoard)]] == childVisits
+  assert {k: nodes.reward_info(nodes.ids[hash(nextBoard)], k) for k in board.snakes} == childInfo
+
+def test_reroot_without_every_move_clears_tree():
+  board, nodes = searched_board()
+  (a, childKey) = first_child(nodes, board)
+
+  nextBoard = copy.deepcopy(board)
+  nextBoard.step(dict(a))
+  nextBoard.add_food(nextBoard.geometry.cell(5, 5))
+  ai.reroot_duct(nodes, hash(board), dict(list(a)[:1]), nextBoard)
+
+  assert len(nodes) == 0
+
+def test_session_tree_is_reused_between_moves(monkeypatch):
+  rd.seed(8)
+  board = sim.generate_board(11, 11, 2)
+  server_logic.start_game({"game": {"id": "g"}})
+
+  server_logic.choose_move(server_logic.convert_to_request(board, "g", 0))
+  assert sessions.sessions["g"].nodes
+
+  # Look at the tree the second search starts from, after it has been rerooted
+  rootVisits = []
+  search_duct = ai.search_duct
+  def recording_search_duct(board, **kwargs):
+    nodes = kwargs["nodes"]
+    rootVisits.append(nodes.visit_count(hash(board)) if hash(board) in nodes else 0)
+    return search_duct(board, **kwargs)
+  monkeypatch.setattr(ai, "search_duct", recording_search_duct)
+
+  board.step({k: ai.safe_player(board, k) for k in board.snakes})
+  server_logic.choose_move(server_logic.convert_to_request(board, "g", 0))
+  assert rootVisits[0] > 0
+  assert hash(sessions.sessions["g"].board) in sessions.sessions["g"].nodes
+
+  server_logic.end_game({"game": {"id": "g"}})
+  assert "g" not in sessions.sessions
+
+def request(board):
+  return server_logic.convert_to_request(board, "g", next(iter(board.snakes)))
+
+def assert_same_board(board, expected):
+  assert board == expected
+  assert hash(board) == hash(expected)
+  assert board.occupancy == expected.occupancy
+
+def test_incremental_conversion_matches_full_conversion():
+  rd.seed(9)
+  board = sim.generate_board(11, 11, 4)
+  converter = server_logic.IncrementalConverter()
+
+  while board.winner() == -1:
+    data = request(board)
+    converted, moves = converter.convert(data)
+    assert_same_board(converted, server_logic.convert_board(data))
+
+    a = {k: ai.safe_player(board, k) for k in board.snakes}
+    board.step(a)
+    if not board.snakes:
+      break
+
+    data = request(board)
+    converted, moves = converter.convert(data)
+    assert_same_board(converted, server_logic.convert_board(data))
+    assert moves == {k: a[k] for k in board.snakes}
+
+def test_incremental_conversion_rebuilds_after_missed_turn():
+  rd.seed(10)
+  board = sim.generate_board(11, 11, 2)
+  converter = server_logic.IncrementalConverter()
+  converter.convert(request(board))
+
+  for i in range(2):
+    board.step({k: ai.safe_player(board, k) for k in board.snakes})
+
+  data = request(board)
+  converted, moves = converter.convert(data)
+  assert_same_board(converted, server_logic.convert_board(data))
+  assert moves == {}  # the moves can't be inferred across a gap
+
+def test_incremental_conversion_rebuilds_for_short_body():
+  rd.seed(12)
+  board = sim.generate_board(11, 11, 2)
+  converter = server_logic.IncrementalConverter()
+
+  for turn in range(2):
+    data = request(board)
+    for snake in data["board"]["snakes"]:
+      snake["body"] = snake["body"][:1]
+    converted, moves = converter.convert(data)
+    assert_same_board(converted, server_logic.convert_board(data))
+    board.step({k: ai.safe_player(board, k) for k in board.snakes})
+
+def test_incremental_conversion_infers_no_moves_across_gap():
+  g = geometry.get_geometry(11, 11)
+  board = sim.BoardState(11, 11, {
+    "a": sim.Snake(g.cell(2, 2), [g.cell(2, 2), g.cell(2, 2)]),
+    "b": sim.Snake(g.cell(8, 8), [g.cell(8, 8), g.cell(8, 8)]),
+  }, set(), 0)
+  converter = server_logic.IncrementalConverter()
+  converter.convert(request(board))
+
+  # Three turns later each head is next to where it was
+  for move in [sim.RIGHT, sim.DOWN, sim.LEFT]:
+    board.step({"a": move, "b": move})
+
+  converted, moves = converter.convert(request(board))
+  assert moves == {}
+
+# The engine grows a snake by stacking a copy of its new tail tip rather than keeping the old tip
+def engine_request(board, ate):
+  data = request(board)
+  for snake in data["board"]["snakes"]:
+    if snake["id"] in ate:
+      snake["body"][-1] = snake["body"][-2]
+  return data
+
+def test_incremental_conversion_handles_engine_growth():
+  rd.seed(11)
+  board = sim.generate_board(11, 11, 2)
+  converter = server_logic.IncrementalConverter()
+  converted, moves = converter.convert(request(board))
+
+  grown = 0
+  while board.winner() == -1 and grown < 3:
+    lengths = {k: snake.length() for k, snake in board.snakes.items()}
+    board.step({k: ai.simple_player(board, k) for k in board.snakes})
+    ate = {k for k, snake in board.snakes.items() if snake.length() > lengths[k]}
+    grown += len(ate)
+
+    data = engine_request(board, ate)
+    previous = converter.board
+    converted, moves = converter.convert(data)
+    assert converted is previous  # updated in place, not rebuilt
+    assert_same_board(converted, server_logic.convert_board(data))
+
+  assert grown > 0
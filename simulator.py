@@ -1,24 +1,14 @@
+import hashlib
 import random as rd
+from collections import deque
 from dataclasses import dataclass
-from typing import List, Set, Dict
+from typing import List, Optional, Set, Dict
 
-@dataclass(frozen=True)
-class Position:
-    x: int
-    y: int
+import geometry
+from geometry import Position, Direction, UP, DOWN, LEFT, RIGHT, MOVES, OFF_BOARD
 
-Direction = Position
-
-def distance(p1: Position, p2: Position):
-  return abs(p1.x - p2.x) + abs(p1.y - p2.y)
-
-UP    = Direction( 0,  1)
-DOWN  = Direction( 0, -1)
-LEFT  = Direction(-1,  0)
-RIGHT = Direction( 1,  0)
-
-# List of available moves
-MOVES = [UP, DOWN, LEFT, RIGHT]
+# Squares on the board are stored as integer cells (see geometry)
+Cell = int
 
 SNAKE_MAX_HEALTH = 100
 
@@ -26,12 +16,65 @@ SNAKE_MAX_HEALTH = 100
 DEFAULT_FOOD_SPAWN_CHANCE=15
 DEFAULT_MIN_FOOD=1
 
-# Class for storing information about a snake
+HASH_MASK = (1 << 64) - 1
+
+# Table of random 64 bit keys used for Zobrist hashing. Keys are generated lazily the first time
+# they are looked up so any board size can be used without building the tables up front.
+class ZobristTable(dict):
+    def __init__(self, seed):
+        super().__init__()
+        self.rng = rd.Random(seed)
+
+    def __missing__(self, key):
+        value = self[key] = self.rng.getrandbits(64)
+        return value
+
+
+# Table of keys for snake ids (integers in the simulator, strings from the server). The server sees
+# new ids in every game, so a ZobristTable would keep growing for as long as it runs. Instead each
+# key is derived from the id with a keyed hash, which gives the same key whenever it is looked up,
+# so the table can simply be emptied once it holds maxKeys of them.
+class SnakeZobristTable(dict):
+    def __init__(self, seed, maxKeys=4096):
+        super().__init__()
+        self.salt = seed.to_bytes(8, "little")
+        self.maxKeys = maxKeys
+
+    def __missing__(self, key):
+        if len(self) >= self.maxKeys:
+            self.clear()
+
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8, key=self.salt).digest()
+        value = self[key] = int.from_bytes(digest, "little")
+        return value
+
+ZOBRIST_HEAD   = ZobristTable(1)
+ZOBRIST_LINK   = ZobristTable(2)
+ZOBRIST_HEALTH = ZobristTable(3)
+ZOBRIST_FOOD   = ZobristTable(4)
+ZOBRIST_TURN   = ZobristTable(5)
+ZOBRIST_SNAKE  = SnakeZobristTable(6)
+
+# Cells are packed into CELL_BITS bits each when two are combined into one key. Masking maps
+# OFF_BOARD (-1) to all ones, which no cell uses on a board of fewer than 2^CELL_BITS squares.
+CELL_BITS = 20
+CELL_MASK = (1 << CELL_BITS) - 1
+
+# Key for the link between two consecutive segments of a snake (from the one nearer the head).
+# Hashing the links rather than the cells means a snake's hash depends on the order of its body, so
+# a snake coiled one way round a loop doesn't hash the same as one coiled the other way.
+def link_key(a: Cell, b: Cell):
+    return ZOBRIST_LINK[((a & CELL_MASK) << CELL_BITS) | (b & CELL_MASK)]
+
+# Class for storing information about a snake. The tail is stored in the same order as the
+# Battlesnake API, starting with the segment next to the head (the neck) and ending with the tip of
+# the tail, so that moving and removing the tip are both O(1) on the deque.
 class Snake:
-    def __init__(self, head: Position, tail: List[Position], health=SNAKE_MAX_HEALTH):
+    def __init__(self, head: Cell, tail: List[Cell], health=SNAKE_MAX_HEALTH):
         self.head = head
-        self.tail = tail
+        self.tail = deque(tail)
         self.health = health
+        self.hash = self.compute_hash()
 
     def __eq__(self, other):
         return (
@@ -41,165 +84,365 @@ class Snake:
         )
 
 
+    # Computes the hash of the snake from scratch. Body links are summed rather than xor'ed so
+    # that stacked segments (e.g. at the start of the game) don't cancel each other out.
+    def compute_hash(self):
+        h = ZOBRIST_HEAD[self.head] + ZOBRIST_HEALTH[self.health]
+        prev = self.head
+        for p in self.tail:
+            h += link_key(prev, p)
+            prev = p
+
+        return h & HASH_MASK
+
     def length(self):
         return len(self.tail) + 1
 
+    def set_health(self, health: int):
+        self.hash = (self.hash - ZOBRIST_HEALTH[self.health] + ZOBRIST_HEALTH[health]) & HASH_MASK
+        self.health = health
+
     def reset_health(self):
-        self.health = SNAKE_MAX_HEALTH
+        self.set_health(SNAKE_MAX_HEALTH)
+
+    # Moves the head of the snake to the given cell (without removing the end of the tail)
+    def move(self, head: Cell):
+        oldHead = self.head
 
-    # Moves the snake in the direction provided (without removing the end of the tail)
-    def move(self, direction: Direction):
         # Add the old position of the head to the tail and then update the head
-        self.tail.append(self.head)
-        self.head = Position(self.head.x + direction.x, self.head.y + direction.y)
+        self.tail.appendleft(oldHead)
+        self.head = head
 
         self.health -= 1
 
-    def contains(self, pos: Position):
+        self.hash = (
+            self.hash
+            + link_key(self.head, oldHead) - ZOBRIST_HEAD[oldHead] + ZOBRIST_HEAD[self.head]
+            - ZOBRIST_HEALTH[self.health + 1] + ZOBRIST_HEALTH[self.health]
+        ) & HASH_MASK
+
+    # Reverts a call to move, putting the head back on the neck and restoring the health the snake
+    # had before it moved
+    def unmove(self, health: int):
+        oldHead = self.tail.popleft()
+
+        self.hash = (
+            self.hash
+            - link_key(self.head, oldHead) + ZOBRIST_HEAD[oldHead] - ZOBRIST_HEAD[self.head]
+            - ZOBRIST_HEALTH[self.health] + ZOBRIST_HEALTH[health]
+        ) & HASH_MASK
+
+        self.head = oldHead
+        self.health = health
+
+    def contains(self, pos: Cell):
         return pos == self.head or pos in self.tail
 
-    # Removes the oldest segment of the tail
+    # Removes the oldest segment of the tail and returns it
     def pop_tail(self):
-        self.tail.pop(0)
-
-# Class for storing the current state of the board
+        pos = self.tail.pop()
+        prev = self.tail[-1] if self.tail else self.head
+        self.hash = (self.hash - link_key(prev, pos)) & HASH_MASK
+        return pos
+
+    # Reverts a call to pop_tail
+    def push_tail(self, pos: Cell):
+        prev = self.tail[-1] if self.tail else self.head
+        self.tail.append(pos)
+        self.hash = (self.hash + link_key(prev, pos)) & HASH_MASK
+
+
+# Set of cells which supports adding, removing and picking random members in O(1). The members are
+# kept in a list (so they can be sampled) and each cell's index in the list is kept in index
+# (-1 when the cell isn't a member).
+class CellSet:
+    def __init__(self, size: int, cells=()):
+        self.cells = []
+        self.index = [-1] * size
+        for c in cells:
+            self.add(c)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, c: Cell):
+        return self.index[c] >= 0
+
+    def add(self, c: Cell):
+        self.index[c] = len(self.cells)
+        self.cells.append(c)
+
+    # Removes c by moving the last member into its place
+    def remove(self, c: Cell):
+        i = self.index[c]
+        last = self.cells.pop()
+        if last != c:
+            self.cells[i] = last
+            self.index[last] = i
+        self.index[c] = -1
+
+
+# Record of everything changed by a call to BoardState.step so that it can be undone
+@dataclass
+class StepDelta:
+    healths: Dict[object, int]          # health of each snake before it moved
+    poppedTails: Dict[object, Cell]     # tail segments removed from snakes that didn't eat
+    eatenFood: Set[Cell]
+    spawnedFood: Set[Cell]
+    eliminated: Dict[object, Snake]
+    order: Optional[List[object]]       # order of the snakes before any were eliminated
+
+# Class for storing the current state of the board. rng is the random.Random used for spawning food
+# (and by the policies and searches in ai which play on the board), so a board given a seeded rng
+# always plays out the same way. Without one the board gets its own unseeded generator.
 class BoardState:
-    def __init__(self, w: int, h: int, snakes: Dict[object, Snake], food: Set[Position], turn, minFood=DEFAULT_MIN_FOOD, foodSpawnChance=DEFAULT_FOOD_SPAWN_CHANCE):
+    def __init__(self, w: int, h: int, snakes: Dict[object, Snake], food: Set[Cell], turn, minFood=DEFAULT_MIN_FOOD, foodSpawnChance=DEFAULT_FOOD_SPAWN_CHANCE, rng=None):
         self.w = w
         self.h = h
+        self.geometry = geometry.get_geometry(w, h)
+        self.rng = rng if rng is not None else rd.Random()
         self.snakes = snakes
         self.food = food
         self.minFood = minFood
         self.foodSpawnChance = foodSpawnChance
         self.turn = turn
+        self.foodHash = 0
+        for f in food:
+            self.foodHash ^= ZOBRIST_FOOD[f]
+
+        # Number of snake segments (heads and tails) in each cell
+        self.occupancy = [0] * (w * h)
+
+        # Cells without any snake segments or food, kept up to date by update_occupancy and the
+        # food methods so that food can be placed without scanning the board
+        self.free = CellSet(w * h, [c for c in range(w * h) if c not in food])
+
+        for snake in snakes.values():
+            self.add_snake_occupancy(snake, 1)
 
     def __eq__(self, other):
         return (
             (self.w == other.w) and
             (self.h == other.h) and
+            (self.turn == other.turn) and
             (self.minFood == other.minFood) and
             (self.foodSpawnChance == other.foodSpawnChance) and
             (self.snakes == other.snakes) and
             (self.food == other.food)
         )
 
+    # The food and snake hashes are maintained incrementally by step, so this only has to combine
+    # one value per snake. Each snake's hash is scaled by a key for its id so that swapping two
+    # snakes gives a different hash.
     def __hash__(self):
-        return 0 # TODO: change this
+        h = self.foodHash ^ ZOBRIST_TURN[self.turn]
+        for k, snake in self.snakes.items():
+            h += (ZOBRIST_SNAKE[k] | 1) * snake.hash
 
+        return h & HASH_MASK
+
+    # Renders the board by drawing food and then each snake onto a grid, so it takes O(w * h) plus
+    # the total length of the snakes. Snakes are drawn in reverse order so that where segments
+    # overlap the earlier snake is shown, and heads are drawn over tails.
     def __str__(self):
-        s = "DIM: " + str(self.w) + " x " + str(self.h) + "\n"
-        s += "Minimum Food: " + str(self.minFood) + "\n"
-        s += "Food Spawn Chance: " + str(self.foodSpawnChance) + "%\n"
+        lines = ["DIM: " + str(self.w) + " x " + str(self.h)]
+        lines.append("Minimum Food: " + str(self.minFood))
+        lines.append("Food Spawn Chance: " + str(self.foodSpawnChance) + "%")
         for k in self.snakes:
-            s += "Health P" + str(k) + ": " + str(self.snakes[k].health) + "\n"
-
-        s += ('# ' * (self.w + 2)) + "\n# "
-        for y in range(self.h):
-            for x in range(self.w):
-                pos = Position(x, y)
-
-                cell = ""
-                for k in self.snakes:
-                    if pos == self.snakes[k].head:
-                        cell = "H"
-                        break
-                    elif pos in self.snakes[k].tail:
-                        cell = str(k)[-1]
-                        break
-                
-                if cell == "":
-                    if pos in self.food:
-                        cell = "*"
-                    else:
-                        cell = " "
-                
-                s += cell + " "
- 
-            s +="#\n# "
-        s += ('# ' * (self.w + 1)) + "\n"
-        return s
-
-    # Checks if a given position is in bounds
-    def is_in_bounds(self, pos: Position):
-        return (0 <= pos.x and pos.x < self.w) and (0 <= pos.y and pos.y < self.h)
+            lines.append("Health P" + str(k) + ": " + str(self.snakes[k].health))
+
+        xs = self.geometry.xs
+        ys = self.geometry.ys
+        grid = [[" "] * self.w for y in range(self.h)]
+        for f in self.food:
+            grid[ys[f]][xs[f]] = "*"
+
+        for k in reversed(list(self.snakes)):
+            label = str(k)[-1]
+            for p in self.snakes[k].tail:
+                if p != OFF_BOARD:
+                    grid[ys[p]][xs[p]] = label
+
+            if self.snakes[k].head != OFF_BOARD:
+                grid[ys[self.snakes[k].head]][xs[self.snakes[k].head]] = "H"
+
+        lines.append("# " * (self.w + 2))
+        for row in grid:
+            lines.append("# " + " ".join(row) + " #")
+        lines.append("# " * (self.w + 2))
+
+        return "\n".join(lines) + "\n"
+
+    # Returns the number of snake segments in a cell (0 if it is OFF_BOARD)
+    def occupancy_at(self, pos: Cell):
+        if pos != OFF_BOARD:
+            return self.occupancy[pos]
+        else:
+            return 0
+
+    def is_occupied(self, pos: Cell):
+        return self.occupancy_at(pos) > 0
+
+    # Adds n to the segment count of a cell. Snakes off the board aren't tracked since they are
+    # eliminated before the end of the step.
+    def update_occupancy(self, pos: Cell, n: int):
+        if pos != OFF_BOARD:
+            old = self.occupancy[pos]
+            self.occupancy[pos] = old + n
+            if old == 0:
+                if pos not in self.food:
+                    self.free.remove(pos)
+            elif old + n == 0 and pos not in self.food:
+                self.free.add(pos)
+
+    def add_snake_occupancy(self, snake: Snake, n: int):
+        self.update_occupancy(snake.head, n)
+        for p in snake.tail:
+            self.update_occupancy(p, n)
+
+    # Removes a snake from the board and returns it
+    def remove_snake(self, k):
+        snake = self.snakes.pop(k)
+        self.add_snake_occupancy(snake, -1)
+        return snake
+
+    def add_food(self, pos: Cell):
+        self.food.add(pos)
+        self.foodHash ^= ZOBRIST_FOOD[pos]
+        if self.occupancy[pos] == 0:
+            self.free.remove(pos)
+
+    def remove_food(self, pos: Cell):
+        self.food.remove(pos)
+        self.foodHash ^= ZOBRIST_FOOD[pos]
+        if self.occupancy[pos] == 0:
+            self.free.add(pos)
 
     # Has each snake attempt to eat any food under its head. If successful the food is removed
     # from the board and the snake's health is reset, otherwise the snake loses the end of its tail.
+    # Returns the food that was eaten and the tail segments that were removed.
     def feed_snakes(self):
         eatenFood = set()
+        poppedTails = {}
         for k in self.snakes:
             if self.snakes[k].head in self.food:
                 self.snakes[k].reset_health()
                 eatenFood.add(self.snakes[k].head)
             else:
-                self.snakes[k].pop_tail()
+                poppedTails[k] = self.snakes[k].pop_tail()
+                self.update_occupancy(poppedTails[k], -1)
 
         for food in eatenFood:
-            self.food.remove(food)
+            self.remove_food(food)
 
-    # Returns a list of all of the squares not being occupied by snakes or food
-    def get_empty_squares(self):
-        emptySquares = {Position(x, y) for x in range(self.w) for y in range(self.h)}
-        emptySquares.difference_update(self.food)
-
-        for snake in self.snakes.values():
-            emptySquares.discard(snake.head)
-            emptySquares.difference_update(snake.tail)
+        return eatenFood, poppedTails
 
-        return list(emptySquares)
+    # Returns a list of all of the cells not being occupied by snakes or food
+    def get_empty_squares(self):
+        return list(self.free.cells)
 
 
-    # Randomly places food in an empty square
+    # Places food in n different randomly chosen empty squares (or every empty square if there are
+    # fewer than n) and returns the food that was placed
     def randomly_place_food(self, n: int):
+        placedFood = set()
         if self.foodSpawnChance != 0:
-            emptySquares = self.get_empty_squares()
-            self.food.update(rd.choices(emptySquares, k=n))
+            placedFood.update(self.rng.sample(self.free.cells, min(n, len(self.free))))
+            for food in placedFood:
+                self.add_food(food)
+
+        return placedFood
 
 
-    # Adds new food to the board
+    # Adds new food to the board and returns the food that was added
     def spawn_food(self):
         if len(self.food) < self.minFood:
-            self.randomly_place_food(self.minFood - len(self.food))
-        elif rd.randrange(100) < self.foodSpawnChance:
-            self.randomly_place_food(1)
+            return self.randomly_place_food(self.minFood - len(self.food))
+        elif self.rng.randrange(100) < self.foodSpawnChance:
+            return self.randomly_place_food(1)
+        else:
+            return set()
 
 
+    # Removes any snakes that have died and returns them
     def eliminate_snakes(self):
+        headCounts = {}
+        for snake in self.snakes.values():
+            headCounts[snake.head] = headCounts.get(snake.head, 0) + 1
+
         toBeEliminated = set()
         for k in self.snakes:
             # Eliminate snakes that are out of bounds or have ran out of health
-            if not self.is_in_bounds(self.snakes[k].head) or self.snakes[k].health <= 0:
+            if self.snakes[k].head == OFF_BOARD or self.snakes[k].health <= 0:
                 toBeEliminated.add(k)
+                continue
 
-            # Eliminate if self intersecting
-            if self.snakes[k].head in self.snakes[k].tail:
+            # Eliminate snakes whose head is on a tail segment (their own or another snake's). Any
+            # segments in the square other than heads must belong to a tail.
+            if self.occupancy_at(self.snakes[k].head) > headCounts[self.snakes[k].head]:
                 toBeEliminated.add(k)
+                continue
 
-            # Eliminate snakes that are colliding with another
-            for k2 in self.snakes:
-                if k != k2:
-                    if (self.snakes[k].head == self.snakes[k2].head and
+            # Eliminate snakes that lose a head to head collision
+            if headCounts[self.snakes[k].head] > 1:
+                for k2 in self.snakes:
+                    if (k != k2 and self.snakes[k].head == self.snakes[k2].head and
                         self.snakes[k].length() <= self.snakes[k2].length()):
-                    
-                        toBeEliminated.add(k)
-                    elif self.snakes[k].head in self.snakes[k2].tail:
+
                         toBeEliminated.add(k)
-                            
-        for k in toBeEliminated:
-            self.snakes.pop(k)
+                        break
+
+        return {k: self.remove_snake(k) for k in toBeEliminated}
 
 
-    # Updates the board by one step using the inputs given for each snake
+    # Updates the board by one step using the inputs given for each snake. Returns a StepDelta
+    # which can be passed to undo to restore the board to exactly how it was before the step.
     def step(self, moves: Dict[object, Direction]):
-        for k in self.snakes:
-            self.snakes[k].move(moves[k])
+        steps = self.geometry.steps
+        healths = {}
+        for k, snake in self.snakes.items():
+            healths[k] = snake.health
+            snake.move(steps[moves[k]][snake.head])
+            self.update_occupancy(snake.head, 1)
+
+        eatenFood, poppedTails = self.feed_snakes()
+        spawnedFood = self.spawn_food()
 
-        self.feed_snakes()
-        self.spawn_food()
-        self.eliminate_snakes()
+        order = list(self.snakes)
+        eliminated = self.eliminate_snakes()
 
         self.turn += 1
 
+        return StepDelta(healths, poppedTails, eatenFood, spawnedFood, eliminated, order if eliminated else None)
+
+    # Reverts the step which produced the given delta. Steps must be undone in the reverse order
+    # that they were made.
+    def undo(self, delta: StepDelta):
+        self.turn -= 1
+
+        if delta.eliminated:
+            remaining = dict(self.snakes)
+            self.snakes.clear()
+            for k in delta.order:
+                self.snakes[k] = remaining[k] if k in remaining else delta.eliminated[k]
+
+            for snake in delta.eliminated.values():
+                self.add_snake_occupancy(snake, 1)
+
+        for food in delta.spawnedFood:
+            self.remove_food(food)
+
+        for food in delta.eatenFood:
+            self.add_food(food)
+
+        for k, snake in self.snakes.items():
+            if k in delta.poppedTails:
+                snake.push_tail(delta.poppedTails[k])
+                self.update_occupancy(delta.poppedTails[k], 1)
+
+            self.update_occupancy(snake.head, -1)
+            snake.unmove(delta.healths[k])
+
     # Returns the winner of the game if the game has ended (or None on a draw).
     # If the game has not ended then -1 is returned
     def winner(self):
@@ -211,23 +454,30 @@ class BoardState:
             return None
 
 
-def generate_board(w: int, h: int, noSnakes: int, minFood=DEFAULT_MIN_FOOD, foodSpawnChance=DEFAULT_FOOD_SPAWN_CHANCE):
+# Creates a board with snakes in random corners and random starting food. The board plays out using
+# rng, or a generator seeded from the random module if one isn't given (so that random.seed still
+# makes games repeatable).
+def generate_board(w: int, h: int, noSnakes: int, minFood=DEFAULT_MIN_FOOD, foodSpawnChance=DEFAULT_FOOD_SPAWN_CHANCE, rng=None):
+    if rng is None:
+        rng = rd.Random(rd.getrandbits(64))
+
+    g = geometry.get_geometry(w, h)
     SNAKE_POSITIONS = ([
-        Position(1, 1),
-        Position(w - 2, h - 2),
-        Position(w - 2, 1),
-        Position(1, h - 2)
+        g.cell(1, 1),
+        g.cell(w - 2, h - 2),
+        g.cell(w - 2, 1),
+        g.cell(1, h - 2)
     ])
 
     if noSnakes == 0 or noSnakes > len(SNAKE_POSITIONS):
         return None
 
     possible_snakes = list(map(lambda p: Snake(p, [p] * 2), SNAKE_POSITIONS))
-    rd.shuffle(possible_snakes)
+    rng.shuffle(possible_snakes)
     snakes = {i: possible_snakes[i] for i in range(noSnakes)}
 
-    possible_food = [Position(x, y) for x in range(w) for y in range(h) if Position(x, y) not in SNAKE_POSITIONS]
-    rd.shuffle(possible_food)
+    possible_food = [c for c in range(g.size) if c not in SNAKE_POSITIONS]
+    rng.shuffle(possible_food)
     food = set(possible_food[:minFood])
     
-    return BoardState(w, h, snakes, food, 0, minFood, foodSpawnChance)
+    return BoardState(w, h, snakes, food, 0, minFood, foodSpawnChance, rng)
@@ -1,5 +1,8 @@
+import copy
 import random as rd
+import geometry
 import simulator as sim
+import ai
 
 board = sim.generate_board(11, 11, 2)
 print(board)
@@ -8,4 +11,144 @@ while board.winner() == -1:
   board.step([sim.MOVES[rd.randrange(len(sim.MOVES))] for i in range(2)])
   print(board)
 
-print(board.winner())
\ No newline at end of file
+print(board.winner())
+
+def rebuild(board: sim.BoardState):
+  snakes = {k: sim.Snake(s.head, list(s.tail), s.health) for k, s in board.snakes.items()}
+  return sim.BoardState(board.w, board.h, snakes, set(board.food), board.turn, board.minFood, board.foodSpawnChance)
+
+def test_incremental_hash_matches_rebuilt_board():
+  rd.seed(1)
+  for i in range(20):
+    board = sim.generate_board(7, 7, 3)
+    while board.winner() == -1:
+      board.step({k: sim.MOVES[rd.randrange(len(sim.MOVES))] for k in board.snakes})
+      assert hash(board) == hash(rebuild(board))
+      assert board.occupancy == rebuild(board).occupancy
+      assert sorted(board.free.cells) == sorted(rebuild(board).free.cells)
+
+def test_hash_depends_on_snake_ids():
+  g = geometry.get_geometry(7, 7)
+  board = sim.BoardState(7, 7, {0: sim.Snake(g.cell(1, 1), []), 1: sim.Snake(g.cell(5, 5), [])}, set(), 0)
+  swapped = sim.BoardState(7, 7, {1: sim.Snake(g.cell(1, 1), []), 0: sim.Snake(g.cell(5, 5), [])}, set(), 0)
+  assert board != swapped
+  assert hash(board) != hash(swapped)
+
+def test_undo_restores_board():
+  rd.seed(2)
+  for i in range(20):
+    board = sim.generate_board(7, 7, 4)
+    history = []
+    while board.winner() == -1:
+      before = copy.deepcopy(board)
+      delta = board.step({k: sim.MOVES[rd.randrange(len(sim.MOVES))] for k in board.snakes})
+      history.append((before, delta))
+
+    for before, delta in reversed(history):
+      board.undo(delta)
+      assert board == before
+      assert list(board.snakes) == list(before.snakes)
+      assert hash(board) == hash(before)
+      assert sorted(board.free.cells) == sorted(before.free.cells)
+
+def reference_eliminations(board: sim.BoardState):
+  eliminated = set()
+  for k, snake in board.snakes.items():
+    if snake.head == sim.OFF_BOARD or snake.health <= 0 or snake.head in snake.tail:
+      eliminated.add(k)
+    for k2, other in board.snakes.items():
+      if k != k2:
+        if snake.head == other.head and snake.length() <= other.length():
+          eliminated.add(k)
+        elif snake.head in other.tail:
+          eliminated.add(k)
+
+  return eliminated
+
+def test_eliminate_snakes_matches_full_scan():
+  rd.seed(3)
+  for i in range(50):
+    board = sim.generate_board(7, 7, 4)
+    while board.winner() == -1:
+      for k, snake in board.snakes.items():
+        snake.move(board.geometry.steps[sim.MOVES[rd.randrange(len(sim.MOVES))]][snake.head])
+        board.update_occupancy(snake.head, 1)
+      board.feed_snakes()
+
+      expected = reference_eliminations(board)
+      assert set(board.eliminate_snakes()) == expected
+      board.turn += 1
+
+def reference_render(board: sim.BoardState):
+  s = ""
+  for y in range(board.h):
+    s += "# "
+    for x in range(board.w):
+      pos = board.geometry.cell(x, y)
+      cell = " "
+      for k in board.snakes:
+        if pos == board.snakes[k].head:
+          cell = "H"
+          break
+        elif pos in board.snakes[k].tail:
+          cell = str(k)[-1]
+          break
+      else:
+        if pos in board.food:
+          cell = "*"
+      s += cell + " "
+    s += "#\n"
+  return s
+
+def test_render_matches_cell_by_cell_scan():
+  rd.seed(9)
+  for i in range(10):
+    board = sim.generate_board(7, 9, 4)
+    while board.winner() == -1:
+      lines = str(board).split("\n")
+      rows = lines[-(board.h + 2):-2]
+      assert "\n".join(rows) + "\n" == reference_render(board)
+      board.step({k: sim.MOVES[rd.randrange(len(sim.MOVES))] for k in board.snakes})
+
+def test_food_is_placed_on_distinct_empty_squares():
+  rd.seed(10)
+  for i in range(20):
+    board = sim.generate_board(5, 5, 2, minFood=30, foodSpawnChance=100)
+    while board.winner() == -1:
+      board.step({k: sim.MOVES[rd.randrange(len(sim.MOVES))] for k in board.snakes})
+      occupied = {c for c in range(board.w * board.h) if board.occupancy[c] > 0}
+      assert not board.food & occupied
+      assert len(board.food) + len(occupied) + len(board.free) == board.w * board.h
+
+def play_seeded_game(seed):
+  board = sim.generate_board(11, 11, 4, rng=rd.Random(seed))
+  history = [hash(board)]
+  while board.winner() == -1:
+    board.step({k: ai.simple_player(board, k) for k in board.snakes})
+    history.append(hash(board))
+  return history
+
+def test_same_seed_gives_same_game():
+  rd.seed(7)
+  assert play_seeded_game(3) == play_seeded_game(3)
+  assert play_seeded_game(3) != play_seeded_game(4)
+
+def test_hash_depends_on_body_order():
+  g = geometry.get_geometry(7, 7)
+  a, b, c, d = g.cell(1, 1), g.cell(2, 1), g.cell(2, 2), g.cell(1, 2)
+  clockwise = sim.BoardState(7, 7, {0: sim.Snake(a, [b, c, d])}, set(), 0)
+  anticlockwise = sim.BoardState(7, 7, {0: sim.Snake(a, [d, c, b])}, set(), 0)
+  assert hash(clockwise) != hash(anticlockwise)
+
+def test_snake_key_table_is_bounded_and_deterministic():
+  table = sim.SnakeZobristTable(6, maxKeys=8)
+  keys = {str(i): table[str(i)] for i in range(8)}
+  for i in range(8, 100):
+    table[f"game-{i}"]
+    assert len(table) <= 8
+  assert all(table[k] == v for k, v in keys.items())
+
+def test_off_board_links_depend_on_cell():
+  g = geometry.get_geometry(7, 7)
+  keys = {sim.link_key(a, sim.OFF_BOARD) for a in range(g.size)}
+  assert len(keys) == g.size
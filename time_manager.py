@@ -0,0 +1,49 @@
+import os
+import time
+
+# Works out how long the search can run for on each turn. The engine gives us game.timeout ms from
+# sending the request to receiving our response. Out of that we have to take:
+#   - the time spent before the search starts (parsing the request, converting the board), which
+#     is measured directly since the deadline is counted from when the request arrived
+#   - the time spent after the search (picking the move and sending the response), which is
+#     estimated from previous turns of the same game
+#   - a margin for network latency between us and the engine
+
+# Timeout used if the request doesn't include one (the engine's default)
+DEFAULT_TIMEOUT = 500
+
+# Milliseconds kept back for the request and response to travel between the engine and us
+LATENCY_MARGIN = float(os.environ.get("BATTLESNAKE_LATENCY_MARGIN_MS", "50"))
+
+# Starting estimate (ms) of the time taken after the search, used until a turn has been measured
+INITIAL_POST_SEARCH_OVERHEAD = 5.0
+
+# Weight given to the latest measurement of the post search overhead
+OVERHEAD_SMOOTHING = 0.25
+
+# The search is always given at least this long (ms) so that it can pick a move
+MIN_SEARCH_TIME = 5.0
+
+
+class TimeManager:
+    def __init__(self):
+        self.postSearchOverhead = INITIAL_POST_SEARCH_OVERHEAD
+        self.searchEnd = None
+
+    # Returns the time.perf_counter() value the search should stop at for a request which arrived at
+    # requestStart
+    def search_deadline(self, data: dict, requestStart: float):
+        timeout = data["game"].get("timeout", DEFAULT_TIMEOUT)
+        budget = timeout - LATENCY_MARGIN - self.postSearchOverhead
+
+        return max(requestStart + budget / 1000, time.perf_counter() + MIN_SEARCH_TIME / 1000)
+
+    def search_finished(self):
+        self.searchEnd = time.perf_counter()
+
+    # Called once the response is ready to be sent to update the estimate of the post search overhead
+    def response_ready(self):
+        if self.searchEnd is not None:
+            overhead = (time.perf_counter() - self.searchEnd) * 1000
+            self.postSearchOverhead += OVERHEAD_SMOOTHING * (overhead - self.postSearchOverhead)
+            self.searchEnd = None
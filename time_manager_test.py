@@ -0,0 +1,45 @@
+import time
+
+import geometry
+import simulator as sim
+import ai
+import time_manager
+
+def test_deadline_leaves_room_for_latency_and_overhead():
+  timing = time_manager.TimeManager()
+  requestStart = time.perf_counter()
+  deadline = timing.search_deadline({"game": {"timeout": 500}}, requestStart)
+
+  expected = 500 - time_manager.LATENCY_MARGIN - time_manager.INITIAL_POST_SEARCH_OVERHEAD
+  assert abs((deadline - requestStart) * 1000 - expected) < 1e-6
+
+def test_deadline_is_never_in_the_past():
+  timing = time_manager.TimeManager()
+  requestStart = time.perf_counter() - 10
+  assert timing.search_deadline({"game": {"timeout": 500}}, requestStart) > time.perf_counter()
+
+def test_post_search_overhead_is_measured():
+  timing = time_manager.TimeManager()
+  timing.search_finished()
+  time.sleep(0.05)
+  timing.response_ready()
+  assert timing.postSearchOverhead > time_manager.INITIAL_POST_SEARCH_OVERHEAD
+
+def test_search_stops_early_with_one_safe_move():
+  # Snake 0 is in the corner with its body blocking one of its two moves
+  g = geometry.get_geometry(11, 11)
+  snakes = {
+    0: sim.Snake(g.cell(0, 0), [g.cell(1, 0), g.cell(2, 0)]),
+    1: sim.Snake(g.cell(5, 5), [g.cell(5, 6), g.cell(5, 7)]),
+  }
+  board = sim.BoardState(11, 11, snakes, {g.cell(8, 8)}, 0)
+
+  tStart = time.perf_counter()
+  move = ai.mcts_duct(board, 0, deadline=tStart + 5)
+  assert move == sim.UP
+  assert time.perf_counter() - tStart < 1
+
+def test_best_move_decided():
+  rewardInfo = {sim.UP: ai.RewardInfo(100, 90), sim.DOWN: ai.RewardInfo(100, -90)}
+  assert ai.best_move_decided(rewardInfo, [sim.UP, sim.DOWN], 10)
+  assert not ai.best_move_decided(rewardInfo, [sim.UP, sim.DOWN], 1000)
@@ -0,0 +1,205 @@
+"""
+Plays seeded self-play games between the policies in ai on a pool of worker processes and reports
+win/draw rates (with 95% Wilson confidence intervals), game lengths and per-move latency.
+
+Policies are named by their function in ai (e.g. safe_player, mcts_duct) or as module.function for
+policies defined elsewhere (e.g. parallel.mcts_duct_root_parallel). With two snakes and two
+policies each policy plays each seat in turn. Game i is played from a board seeded with seed + i, so
+the same seed always gives the same starting positions and food, and the same games for policies
+which don't search against the clock.
+
+Run from the root of the repository with, for example:
+
+    python -m tournament mcts_suct mcts_duct --games 1000 --time 100 --json results.json
+"""
+import argparse
+import csv
+import importlib
+import inspect
+import json
+import math
+import os
+import random as rd
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import simulator as sim
+import ai
+
+# z value for the 95% confidence intervals of the win and draw rates
+CONFIDENCE_Z = 1.96
+
+# Games still going after this many turns are counted as draws
+DEFAULT_MAX_TURNS = 1000
+
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+@dataclass
+class GameResult:
+    seed: int
+    policies: Dict[object, str]         # policy played by each snake
+    winner: Optional[str]               # policy of the winning snake, None for a draw
+    turns: int
+    latencies: Dict[str, List[float]] = field(default_factory=dict)  # ms per move for each policy
+
+
+# Returns the function for a policy name (see the module docstring)
+def get_policy(name: str):
+    moduleName, _, functionName = name.rpartition(".")
+    module = importlib.import_module(moduleName) if moduleName else ai
+    return getattr(module, functionName)
+
+
+# Returns whether the policy function takes a time budget and whether it takes a search seed
+def policy_options(function):
+    parameters = inspect.signature(function).parameters
+    return "maxTime" in parameters, "seed" in parameters
+
+
+# Assigns the policies to the snakes of game, rotating the seats between games
+def seat_policies(policies: List[str], snakes, game: int):
+    return {k: policies[(i + game) % len(policies)] for i, k in enumerate(snakes)}
+
+
+def play_game(policies: List[str], game: int, seed: int, w: int, h: int, noSnakes: int, maxTime: int, maxTurns=DEFAULT_MAX_TURNS):
+    gameSeed = seed + game
+    board = sim.generate_board(w, h, noSnakes, rng=rd.Random(gameSeed))
+    seats = seat_policies(policies, board.snakes, game)
+    functions = {k: get_policy(p) for k, p in seats.items()}
+    options = {k: policy_options(f) for k, f in functions.items()}
+
+    # Each snake's searches get their own seed stream so the snakes don't make the same choices
+    searchRngs = {k: rd.Random(f"{gameSeed}:{i}") for i, k in enumerate(board.snakes)}
+
+    latencies = {p: [] for p in policies}
+    while board.winner() == -1 and board.turn < maxTurns:
+        moves = {}
+        for k in board.snakes:
+            timed, seeded = options[k]
+            kwargs = {}
+            if timed:
+                kwargs["maxTime"] = maxTime
+            if seeded:
+                kwargs["seed"] = searchRngs[k].getrandbits(64)
+
+            tStart = time.perf_counter()
+            moves[k] = functions[k](board, k, **kwargs)
+            latencies[seats[k]].append((time.perf_counter() - tStart) * 1000)
+
+        board.step(moves)
+
+    winner = board.winner()
+    winnerPolicy = seats[winner] if winner not in (-1, None) else None
+    return GameResult(gameSeed, seats, winnerPolicy, board.turn, latencies)
+
+
+def play_games(policies: List[str], games: int, seed=0, w=11, h=11, noSnakes=2, maxTime=100, maxTurns=DEFAULT_MAX_TURNS, workers=None):
+    # A fresh pool rather than parallel's, which is for the workers of a single search
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(play_game, policies, i, seed, w, h, noSnakes, maxTime, maxTurns) for i in range(games)]
+        return [f.result() for f in futures]
+
+
+# ----- Statistics -----#
+
+# Returns the Wilson score interval for successes out of n trials
+def wilson_interval(successes: int, n: int, z=CONFIDENCE_Z):
+    if n == 0:
+        return (0.0, 1.0)
+
+    p = successes / n
+    centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+    halfWidth = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return (max(0.0, centre - halfWidth), min(1.0, centre + halfWidth))
+
+
+# Returns the qth percentile of xs using linear interpolation between the closest ranks
+def percentile(xs: List[float], q: float):
+    if not xs:
+        return None
+
+    xs = sorted(xs)
+    pos = (len(xs) - 1) * q / 100
+    lower = math.floor(pos)
+    upper = min(lower + 1, len(xs) - 1)
+    return xs[lower] + (xs[upper] - xs[lower]) * (pos - lower)
+
+
+def summarise(policies: List[str], results: List[GameResult]):
+    n = len(results)
+    draws = sum(r.winner is None for r in results)
+    turns = [r.turns for r in results]
+
+    summary = {
+        "games": n,
+        "draws": draws,
+        "drawRate": draws / n if n else 0.0,
+        "drawInterval": wilson_interval(draws, n),
+        "turns": {"mean": sum(turns) / n if n else None, **{f"p{q}": percentile(turns, q) for q in LATENCY_PERCENTILES}},
+        "policies": {},
+    }
+
+    for p in dict.fromkeys(policies):
+        wins = sum(r.winner == p for r in results)
+        latencies = [t for r in results for t in r.latencies.get(p, [])]
+        summary["policies"][p] = {
+            "wins": wins,
+            "winRate": wins / n if n else 0.0,
+            "winInterval": wilson_interval(wins, n),
+            "moves": len(latencies),
+            "latencyMs": {f"p{q}": percentile(latencies, q) for q in LATENCY_PERCENTILES + [100]},
+        }
+
+    return summary
+
+
+# Writes one row per policy to path
+def write_csv(summary, path: str):
+    percentiles = LATENCY_PERCENTILES + [100]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["policy", "games", "wins", "win_rate", "win_low", "win_high", "draw_rate", "draw_low", "draw_high", "mean_turns", "moves"]
+                        + [f"latency_p{q}_ms" for q in percentiles])
+        for p, info in summary["policies"].items():
+            writer.writerow([p, summary["games"], info["wins"], info["winRate"], *info["winInterval"], summary["drawRate"], *summary["drawInterval"],
+                             summary["turns"]["mean"], info["moves"]] + [info["latencyMs"][f"p{q}"] for q in percentiles])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("policies", nargs="+", help="policies to play against each other")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--width", type=int, default=11)
+    parser.add_argument("--height", type=int, default=11)
+    parser.add_argument("--snakes", type=int, default=2)
+    parser.add_argument("--time", type=int, default=100, help="search time per move in ms")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", help="file to write the summary to as JSON")
+    parser.add_argument("--csv", help="file to write the summary to as CSV")
+    args = parser.parse_args()
+
+    for p in args.policies:
+        get_policy(p)  # fail before starting any games if a policy doesn't exist
+
+    results = play_games(args.policies, args.games, args.seed, args.width, args.height, args.snakes, args.time, args.max_turns, args.workers)
+    summary = summarise(args.policies, results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.csv:
+        write_csv(summary, args.csv)
+    if not args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import csv
+import json
+
+import tournament
+
+def test_seeded_games_are_repeatable():
+  first = tournament.play_game(["safe_player", "chase_food"], 3, 10, 7, 7, 2, 10)
+  second = tournament.play_game(["safe_player", "chase_food"], 3, 10, 7, 7, 2, 10)
+  assert (first.winner, first.turns) == (second.winner, second.turns)
+  assert sorted(first.policies.values()) == ["chase_food", "safe_player"]
+
+def test_seats_rotate_between_games():
+  assert tournament.seat_policies(["a", "b"], [0, 1], 0) == {0: "a", 1: "b"}
+  assert tournament.seat_policies(["a", "b"], [0, 1], 1) == {0: "b", 1: "a"}
+
+def test_policies_outside_ai_can_be_named():
+  assert tournament.get_policy("simple_player") is tournament.ai.simple_player
+  assert tournament.get_policy("ai.mcts_duct") is tournament.ai.mcts_duct
+  assert tournament.policy_options(tournament.ai.mcts_duct) == (True, True)
+  assert tournament.policy_options(tournament.ai.safe_player) == (False, False)
+
+def test_wilson_interval_contains_rate():
+  low, high = tournament.wilson_interval(30, 100)
+  assert low < 0.3 < high
+  assert tournament.wilson_interval(0, 10)[0] == 0.0
+
+def test_summary_counts_every_game(tmp_path):
+  results = tournament.play_games(["safe_player", "mcts_duct"], 4, seed=5, w=7, h=7, maxTime=5, workers=2)
+  summary = tournament.summarise(["safe_player", "mcts_duct"], results)
+
+  assert summary["games"] == 4
+  assert summary["draws"] + sum(p["wins"] for p in summary["policies"].values()) == 4
+  assert summary["policies"]["mcts_duct"]["latencyMs"]["p50"] is not None
+  json.dumps(summary)
+
+  tournament.write_csv(summary, tmp_path / "summary.csv")
+  with open(tmp_path / "summary.csv") as f:
+    assert len(list(csv.reader(f))) == 3